@@ -0,0 +1,157 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+from sqlalchemy import case
+from sqlalchemy.dialects import postgresql, sqlite
+from app.database.database import SessionLocal
+from app.models import models
+
+BUCKET_SECONDS = 60
+
+
+def current_bucket() -> int:
+    return int(time.time()) // BUCKET_SECONDS * BUCKET_SECONDS
+
+
+def bucket_datetime(bucket: int) -> datetime:
+    return datetime.fromtimestamp(bucket, tz=timezone.utc)
+
+
+class ActivityBucket:
+    __slots__ = ("joins", "active_sockets", "connections_made", "messages")
+
+    def __init__(self, active_sockets: int = 0):
+        self.joins = 0
+        self.active_sockets = active_sockets
+        self.connections_made = 0
+        self.messages = 0
+
+    def merge(self, other: "ActivityBucket"):
+        self.joins += other.joins
+        self.active_sockets = max(self.active_sockets, other.active_sockets)
+        self.connections_made += other.connections_made
+        self.messages += other.messages
+
+    def as_dict(self, bucket: int) -> dict:
+        return {
+            "bucket_start": bucket_datetime(bucket),
+            "joins": self.joins,
+            "active_sockets": self.active_sockets,
+            "connections_made": self.connections_made,
+            "messages": self.messages,
+        }
+
+
+class ActivityRollups:
+    """
+    Per-minute activity counters for each event.
+
+    Recording an activity is a dict lookup and an increment. A background task
+    periodically swaps out the pending buckets and upserts them into
+    `event_activity`, adding counts and keeping the peak socket count.
+    """
+
+    def __init__(self, flush_interval: float = 10.0):
+        self.flush_interval = flush_interval
+        self.active_sockets: Dict[str, int] = {}
+        self._pending: Dict[Tuple[str, int], ActivityBucket] = {}
+        self._flush_task = None
+
+    def _bucket(self, event_id: str) -> ActivityBucket:
+        key = (event_id, current_bucket())
+        bucket = self._pending.get(key)
+        if bucket is None:
+            bucket = self._pending[key] = ActivityBucket(
+                self.active_sockets.get(event_id, 0)
+            )
+        return bucket
+
+    def record_join(self, event_id: str):
+        self._bucket(event_id).joins += 1
+
+    def record_connection(self, event_id: str):
+        self._bucket(event_id).connections_made += 1
+
+    def record_message(self, event_id: str):
+        self._bucket(event_id).messages += 1
+
+    def socket_opened(self, event_id: str):
+        count = self.active_sockets.get(event_id, 0) + 1
+        self.active_sockets[event_id] = count
+        bucket = self._bucket(event_id)
+        bucket.active_sockets = max(bucket.active_sockets, count)
+
+    def socket_closed(self, event_id: str):
+        count = self.active_sockets.get(event_id, 0) - 1
+        if count > 0:
+            self.active_sockets[event_id] = count
+        else:
+            self.active_sockets.pop(event_id, None)
+        self._bucket(event_id)
+
+    def pending_for(self, event_id: str) -> Dict[int, ActivityBucket]:
+        return {
+            bucket: counts
+            for (pending_event, bucket), counts in list(self._pending.items())
+            if pending_event == event_id
+        }
+
+    def start(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        # Events with open sockets get a bucket every minute so the socket
+        # series has no gaps while nothing else happens.
+        for event_id in list(self.active_sockets):
+            self._bucket(event_id)
+
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            await asyncio.to_thread(self._write, pending)
+        except Exception as e:
+            print(f"Error flushing activity rollups: {str(e)}")
+            for key, counts in pending.items():
+                self._pending.setdefault(key, ActivityBucket()).merge(counts)
+
+    def _write(self, pending: Dict[Tuple[str, int], ActivityBucket]):
+        db = SessionLocal()
+        try:
+            dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+            table = models.EventActivity.__table__
+            rows: List[dict] = [
+                {"event_id": event_id, **counts.as_dict(bucket)}
+                for (event_id, bucket), counts in pending.items()
+            ]
+            statement = dialect.insert(table).values(rows)
+            excluded = statement.excluded
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.event_id, table.c.bucket_start],
+                set_={
+                    "joins": table.c.joins + excluded.joins,
+                    "active_sockets": case(
+                        (excluded.active_sockets > table.c.active_sockets, excluded.active_sockets),
+                        else_=table.c.active_sockets,
+                    ),
+                    "connections_made": table.c.connections_made + excluded.connections_made,
+                    "messages": table.c.messages + excluded.messages,
+                },
+            )
+            db.execute(statement)
+            db.commit()
+        finally:
+            db.close()
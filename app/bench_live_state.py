@@ -0,0 +1,120 @@
+import argparse
+import gc
+import json
+import tracemalloc
+import uuid
+from app.websockets.live_state import LiveState
+from app.websockets.subscriptions import EventRoutingIndex, Subscription
+
+
+class FakeSocket:
+    __slots__ = ()
+
+
+def measure(build):
+    """
+    Returns the bytes still allocated by whatever `build` returns.
+    """
+    gc.collect()
+    tracemalloc.start()
+    kept = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def make_profile(i):
+    return {
+        "github": f"https://github.com/attendee{i}",
+        "linkedin": f"https://linkedin.com/in/attendee{i}",
+        "skills": ["Python", "FastAPI", "React"],
+        "bio": "Building things at the hackathon",
+    }
+
+
+def copy(value):
+    # ids arrive as fresh strings from each request path and query row
+    return "".join(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure bytes per connected attendee for live event state."
+    )
+    parser.add_argument("-s", "--sockets", type=int, default=10000)
+    parser.add_argument("-e", "--events", type=int, default=10)
+    args = parser.parse_args()
+
+    user_ids = [str(uuid.uuid4()) for _ in range(args.sockets)]
+    event_ids = [str(uuid.uuid4()) for _ in range(args.events)]
+    sockets = [FakeSocket() for _ in range(args.sockets)]
+    profiles = [make_profile(i) for i in range(args.sockets)]
+    roles = ["participant", "mentor", "organizer"]
+
+    def event_for(i):
+        return event_ids[i % args.events]
+
+    def snapshot_rows(event_id):
+        indices = [i for i in range(args.sockets) if event_for(i) == event_id]
+        participants = [
+            {"id": copy(user_ids[i]), "role": copy(roles[i % 3])} for i in indices
+        ]
+        connections = [
+            {"source": copy(user_ids[a]), "target": copy(user_ids[b])}
+            for a, b in zip(indices, indices[1:])
+        ]
+        return {"participants": participants, "connections": connections}
+
+    def dict_state():
+        # Plain dict/set membership, per-socket subscriptions, no interning
+        active_connections = {}
+        event_participants = {}
+        routing = {}
+        for event_id in event_ids:
+            routing[event_id] = EventRoutingIndex()
+            routing[event_id].load_snapshot(snapshot_rows(event_id))
+        for i, user_id in enumerate(user_ids):
+            user_id = copy(user_id)
+            active_connections[user_id] = sockets[i]
+            event_participants.setdefault(event_for(i), set()).add(user_id)
+            routing[event_for(i)].subscribe(user_id, Subscription())
+        return active_connections, event_participants, routing
+
+    def compact_state():
+        state = LiveState()
+        routing = {}
+        for event_id in event_ids:
+            routing[event_id] = EventRoutingIndex(state.users.canonical)
+            routing[event_id].load_snapshot(snapshot_rows(event_id))
+        for i, user_id in enumerate(user_ids):
+            user_id = copy(user_id)
+            state.add(user_id, event_for(i), sockets[i])
+            routing[event_for(i)].subscribe(user_id)
+        return state, routing
+
+    def dict_profiles():
+        # A snapshot cache holding participant dicts with decoded profiles
+        return [
+            {"id": user_id, "profile": {**profiles[i], "skills": list(profiles[i]["skills"])}}
+            for i, user_id in enumerate(user_ids)
+        ]
+
+    def compact_profiles():
+        # CachedSnapshot's pre-encoded profiles
+        return [json.dumps(profile, separators=(",", ":")) for profile in profiles]
+
+    rows = [
+        ("sockets + routing (dicts)", measure(dict_state)),
+        ("sockets + routing (interned)", measure(compact_state)),
+        ("profiles (dicts)", measure(dict_profiles)),
+        ("profiles (pre-encoded)", measure(compact_profiles)),
+    ]
+    print(f"{args.sockets} sockets across {args.events} events")
+    for name, size in rows:
+        print(f"{name:<30} {size:>12,} bytes  {size / args.sockets:8.1f} bytes/attendee")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import gzip
+import mimetypes
+import os
+import re
+import stat
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # .br variants are only written when brotli is installed
+    brotli = None
+
+# Vite names build output `[name]-[hash][extname]`, e.g. `index-BxYz12_a.js`:
+# a dash, then exactly 8 url-safe characters right before the extension.
+# Requiring a digit or capital keeps names like `icon-fallback.svg` out.
+HASHED_NAME = re.compile(r"-(?=[A-Za-z0-9_-]{0,7}[A-Z0-9])[A-Za-z0-9_-]{8}\.\w+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Preferred first when the client accepts both
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE = {".html", ".js", ".mjs", ".css", ".json", ".svg", ".txt", ".map", ".xml", ".wasm"}
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """
+    Returns the content codings an Accept-Encoding header allows, dropping
+    any listed with q=0.
+    """
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name)
+    if "*" in accepted:
+        accepted.update(encoding for encoding, _ in ENCODINGS)
+    return accepted
+
+
+class _Variants:
+    __slots__ = ("mtime", "size", "encoded")
+
+    def __init__(self, stat_result: os.stat_result, encoded: Dict[str, Tuple[str, os.stat_result]]):
+        self.mtime = stat_result.st_mtime_ns
+        self.size = stat_result.st_size
+        self.encoded = encoded
+
+
+class _MemoryFileResponse(FileResponse):
+    """
+    A FileResponse that serves whole-file GETs from an in-memory copy.
+    Range and HEAD requests go through the regular file path.
+    """
+
+    def __init__(self, *args, cache: "PrecompressedStaticFiles", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["method"] != "GET" or "range" in Headers(scope=scope):
+            await super().__call__(scope, receive, send)
+            return
+        body = await self.cache.read_small(self.path, self.stat_result)
+        if body is None:
+            # Rewritten since it was looked up, so the stat headers are stale;
+            # let FileResponse stat it again and stream it
+            self.stat_result = None
+            for name in ("content-length", "last-modified", "etag"):
+                del self.headers[name]
+            await super().__call__(scope, receive, send)
+            return
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles for the built frontend.
+
+    Serves a `.br` or `.gz` file written next to an asset at build time
+    (see `main` below) when the client accepts that encoding. Hashed
+    filenames are cached for a year as immutable; everything else is
+    revalidated against its ETag. Range requests always get the identity
+    bytes, since that is what resuming clients expect. Files up to
+    `memory_limit` bytes are kept in memory, up to `memory_budget` in total.
+    """
+
+    def __init__(
+        self,
+        *args,
+        memory_limit: int = 64 * 1024,
+        memory_budget: int = 32 * 1024 * 1024,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.memory_limit = memory_limit
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self._memory: Dict[str, Tuple[int, int, bytes]] = {}
+        self._variants: Dict[str, _Variants] = {}
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        path, served_stat, encoding = str(full_path), stat_result, None
+        variants = self._variants_for(path, stat_result)
+        if variants.encoded and "range" not in request_headers:
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            for name, _ in ENCODINGS:
+                if name in accepted and name in variants.encoded:
+                    path, served_stat = variants.encoded[name]
+                    encoding = name
+                    break
+
+        headers = {
+            "cache-control": IMMUTABLE
+            if HASHED_NAME.search(os.path.basename(str(full_path)))
+            else REVALIDATE
+        }
+        if variants.encoded:
+            headers["vary"] = "Accept-Encoding"
+        if encoding is not None:
+            headers["content-encoding"] = encoding
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+
+        if served_stat.st_size <= self.memory_limit:
+            response = _MemoryFileResponse(
+                path,
+                status_code=status_code,
+                headers=headers,
+                media_type=media_type,
+                stat_result=served_stat,
+                cache=self,
+            )
+        else:
+            response = FileResponse(
+                path,
+                status_code=status_code,
+                headers=headers,
+                media_type=media_type,
+                stat_result=served_stat,
+            )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def _variants_for(self, path: str, stat_result: os.stat_result) -> _Variants:
+        """
+        Finds an asset's precompressed siblings once per version of the
+        asset; a variant older than its source is ignored as stale.
+        """
+        variants = self._variants.get(path)
+        if (
+            variants is None
+            or variants.mtime != stat_result.st_mtime_ns
+            or variants.size != stat_result.st_size
+        ):
+            encoded = {}
+            for name, suffix in ENCODINGS:
+                try:
+                    variant_stat = os.stat(path + suffix)
+                except OSError:
+                    continue
+                if stat.S_ISREG(variant_stat.st_mode) and variant_stat.st_mtime >= stat_result.st_mtime:
+                    encoded[name] = (path + suffix, variant_stat)
+            variants = self._variants[path] = _Variants(stat_result, encoded)
+        return variants
+
+    async def read_small(self, path: str, stat_result: os.stat_result) -> Optional[bytes]:
+        """
+        Returns the file's bytes, from memory when `stat_result` still
+        matches, or None when its size no longer matches `stat_result`.
+        """
+        cached = self._memory.get(path)
+        if cached is not None and cached[:2] == (stat_result.st_mtime_ns, stat_result.st_size):
+            return cached[2]
+        async with await anyio.open_file(path, "rb") as file:
+            body = await file.read()
+        if len(body) != stat_result.st_size:
+            return None
+        if cached is not None:
+            self.memory_used -= len(cached[2])
+            del self._memory[path]
+        if self.memory_used + len(body) <= self.memory_budget:
+            self._memory[path] = (stat_result.st_mtime_ns, stat_result.st_size, body)
+            self.memory_used += len(body)
+        return body
+
+
+def precompress(directory: str, min_size: int = 1024) -> List[str]:
+    """
+    Writes `.gz` (and `.br` when brotli is installed) next to every
+    compressible file under `directory` that does not already have an
+    up-to-date variant. Returns the paths written.
+    """
+    written = []
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            path = os.path.join(root, filename)
+            if os.path.splitext(filename)[1].lower() not in COMPRESSIBLE:
+                continue
+            source_stat = os.stat(path)
+            if source_stat.st_size < min_size:
+                continue
+            data = None
+            for name, suffix in ENCODINGS:
+                if name == "br" and brotli is None:
+                    continue
+                target = path + suffix
+                if os.path.exists(target) and os.stat(target).st_mtime >= source_stat.st_mtime:
+                    continue
+                if data is None:
+                    with open(path, "rb") as file:
+                        data = file.read()
+                if name == "br":
+                    encoded = brotli.compress(data, quality=11)
+                else:
+                    encoded = gzip.compress(data, compresslevel=9, mtime=0)
+                # Not worth serving if compression barely helps
+                if len(encoded) >= len(data) * 0.95:
+                    continue
+                with open(target, "wb") as file:
+                    file.write(encoded)
+                written.append(target)
+    return written
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Write precompressed .br/.gz variants of built static assets."
+    )
+    parser.add_argument("directory", nargs="?", default="static")
+    parser.add_argument("--min-size", type=int, default=1024)
+    args = parser.parse_args(argv)
+    written = precompress(args.directory, args.min_size)
+    if brotli is None:
+        print("brotli is not installed; only .gz variants were written")
+    print(f"Wrote {len(written)} precompressed files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import uuid
+from typing import Dict, Optional
+
+
+class ResourceVersions:
+    """
+    In-memory version counters for cacheable resources.
+
+    Every write that changes a resource bumps its key, and the current
+    version is surfaced to clients as a strong ETag. The epoch changes on
+    each process start so ETags from a previous run (or another worker)
+    never match by accident.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._versions: Dict[str, int] = {}
+
+    def bump(self, *keys: str):
+        for key in keys:
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def version(self, key: str) -> int:
+        return self._versions.get(key, 0)
+
+    def etag(self, key: str) -> str:
+        return f'"{key}.{self.epoch}.{self.version(key)}"'
+
+    def rotate_epoch(self):
+        """
+        Invalidates every ETag handed out so far, for when some bumps may
+        have been missed (e.g. a failed shard sync).
+        """
+        self.epoch = uuid.uuid4().hex[:12]
+
+    @staticmethod
+    def matches(etag: str, if_none_match: Optional[str]) -> bool:
+        """
+        Checks an If-None-Match header against an ETag. If-None-Match uses the
+        weak comparison function, so a W/ prefix on the client's tag is ignored.
+        """
+        if not if_none_match:
+            return False
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate == "*":
+                return True
+            if candidate.startswith("W/"):
+                candidate = candidate[2:]
+            if candidate == etag:
+                return True
+        return False
+
+
+def users_key() -> str:
+    return "users"
+
+
+def user_key(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def events_key() -> str:
+    return "events"
+
+
+def graph_key(event_id: str) -> str:
+    return f"graph:{event_id}"
+
+
+def participants_key(event_id: str) -> str:
+    return f"participants:{event_id}"
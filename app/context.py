@@ -1,7 +1,15 @@
 import os
 import argparse
+import codecs
 import logging
 import fnmatch
+import hashlib
+import json
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_VERSION = 1
 
 
 def is_text_file(file_path, blocksize=512):
@@ -98,6 +106,362 @@ def read_ignore_dirs(ignore_list, source_dir):
     return ignore_dirs
 
 
+def compile_patterns(patterns):
+    """
+    Compiles fnmatch-style patterns into one regex, so a name is checked
+    against all of them in a single match. Returns None for no patterns.
+    """
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns))
+
+
+def _gitignore_regex(pattern):
+    """
+    Translates the glob part of a .gitignore rule into a regex body.
+    """
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+            else:
+                body = pattern[i + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+                i = end + 1
+        elif c == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+
+def parse_gitignore(text):
+    """
+    Parses .gitignore contents into (regex, negate, dir_only) rules, matched
+    against paths relative to the .gitignore's directory with "/" separators.
+    """
+    rules = []
+    for line in text.splitlines():
+        if not line.strip() or line.startswith("#"):
+            continue
+        # Trailing spaces are ignored unless escaped
+        line = re.sub(r"(?<!\\)\s+$", "", line)
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith(("\\!", "\\#")):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # A slash anywhere but the end anchors the rule to this directory
+        anchored = "/" in line
+        body = _gitignore_regex(line.lstrip("/"))
+        prefix = "" if anchored else "(?:.*/)?"
+        rules.append((re.compile(f"^{prefix}{body}$"), negate, dir_only))
+    return rules
+
+
+def is_gitignored(rule_sets, relative_path, is_dir):
+    """
+    Applies the rule sets of every .gitignore above a path, deepest first;
+    within a file the last matching rule wins.
+    """
+    for base, rules in reversed(rule_sets):
+        path = relative_path[len(base) + 1 :] if base else relative_path
+        for regex, negate, dir_only in reversed(rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(path):
+                return not negate
+    return False
+
+
+def read_text(file_path, chunk_size=1024 * 1024):
+    """
+    Reads a file once, returning its text with universal newlines (as the
+    text-mode read above does), or None for binary and non-UTF-8 files,
+    along with a hash of its bytes. Files are read and hashed a chunk at a
+    time; binary files, recognized by a NUL in the first 512 bytes, are only
+    hashed, so they are never held in memory whole.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts = []
+    with open(file_path, "rb") as file:
+        chunk = file.read(512)
+        if b"\0" in chunk:
+            parts = None
+        while chunk:
+            digest.update(chunk)
+            if parts is not None:
+                try:
+                    parts.append(decoder.decode(chunk))
+                except UnicodeDecodeError:
+                    parts = None
+            chunk = file.read(chunk_size)
+    if parts is not None:
+        try:
+            parts.append(decoder.decode(b"", final=True))
+        except UnicodeDecodeError:
+            parts = None
+    if parts is None:
+        return None, digest.hexdigest()
+    text = "".join(parts)
+    return text.replace("\r\n", "\n").replace("\r", "\n"), digest.hexdigest()
+
+
+def scan_tree(source_dir, ignore_dirs, ignore_files, skip_paths, use_gitignore):
+    """
+    Yields (relative_path, absolute_path, stat) for every file to bundle, in
+    sorted order. `ignore_dirs` and `ignore_files` are compiled patterns or
+    None; `skip_paths` is a set of absolute paths to leave out.
+    """
+    stack = [("", source_dir, [])]
+    while stack:
+        relative_dir, directory, rule_sets = stack.pop()
+        if use_gitignore:
+            gitignore = os.path.join(directory, ".gitignore")
+            if os.path.isfile(gitignore):
+                with open(gitignore, "r", encoding="utf-8", errors="replace") as file:
+                    rules = parse_gitignore(file.read())
+                if rules:
+                    rule_sets = rule_sets + [(relative_dir, rules)]
+
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            logging.info(f"Failed to list {relative_dir or '.'}: {e}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            relative = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if is_dir:
+                if (
+                    entry.name == ".git"
+                    or (ignore_dirs is not None and ignore_dirs.match(entry.name))
+                    or entry.path in skip_paths
+                    or (rule_sets and is_gitignored(rule_sets, relative, True))
+                ):
+                    logging.info(f"Skipped directory: {relative}")
+                    continue
+                subdirs.append((relative, entry.path, rule_sets))
+            elif entry.is_file(follow_symlinks=False):
+                if entry.path in skip_paths:
+                    continue
+                if (ignore_files is not None and ignore_files.match(entry.name)) or (
+                    rule_sets and is_gitignored(rule_sets, relative, False)
+                ):
+                    logging.info(f"Skipped file (ignored): {relative}")
+                    continue
+                yield relative, entry.path, entry.stat(follow_symlinks=False)
+        # Reversed so the stack pops subdirectories in sorted order
+        stack.extend(reversed(subdirs))
+
+
+def load_manifest(manifest_file, output_file):
+    """
+    Loads the previous run's manifest, or an empty one if it is missing,
+    from another version, or its output file has changed since.
+    """
+    try:
+        with open(manifest_file, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        output_stat = os.stat(output_file)
+    except (OSError, ValueError):
+        return {}
+    if (
+        manifest.get("version") != MANIFEST_VERSION
+        or manifest.get("output_size") != output_stat.st_size
+        or manifest.get("output_mtime_ns") != output_stat.st_mtime_ns
+    ):
+        return {}
+    return manifest.get("files", {})
+
+
+def bundle_directory(
+    source_dir,
+    output_file,
+    ignore_dirs=None,
+    ignore_files=None,
+    manifest_file=None,
+    max_bytes=None,
+    workers=None,
+    use_gitignore=True,
+    log_file=None,
+):
+    """
+    Incremental, parallel version of copy_directory_contents_to_file with
+    the same output format.
+
+    Ignore patterns are compiled once and .gitignore files are honored.
+    A manifest next to the output records each file's mtime, size, content
+    hash and position in the output; on the next run unchanged files are
+    copied from the previous output instead of being opened again, and only
+    new or changed files are read, in a thread pool. Output is streamed to a
+    temporary file and stops at `max_bytes`. Returns a dict of counts.
+    """
+    if log_file:
+        logging.basicConfig(filename=log_file, level=logging.INFO, format="%(message)s")
+    else:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    source_dir = os.path.abspath(source_dir)
+    output_file = os.path.abspath(output_file)
+    manifest_file = os.path.abspath(manifest_file or output_file + ".manifest.json")
+    ignore_dirs = ignore_dirs or []
+    skip_paths = {output_file, manifest_file, output_file + ".tmp"}
+    if log_file:
+        skip_paths.add(os.path.abspath(log_file))
+    # Entries with a separator are paths; the rest are name patterns
+    dir_patterns = [d for d in ignore_dirs if os.sep not in d and "/" not in d]
+    for d in ignore_dirs:
+        if d not in dir_patterns:
+            skip_paths.add(os.path.normpath(os.path.join(source_dir, d)))
+    dir_regex = compile_patterns(dir_patterns)
+    file_regex = compile_patterns(ignore_files)
+
+    previous = load_manifest(manifest_file, output_file)
+    files = {}
+    stats = {"files": 0, "reused": 0, "read": 0, "skipped": 0, "truncated": False}
+    temp_file = output_file + ".tmp"
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+
+    def read_entry(item):
+        relative, path, stat_result = item
+        try:
+            text, digest = read_text(path)
+        except OSError as e:
+            return item, None, None, e
+        return item, text, digest, None
+
+    old_output = open(output_file, "rb") if previous else None
+    try:
+        with open(temp_file, "wb") as outfile, ThreadPoolExecutor(workers) as executor:
+            pending = deque()
+            written = 0
+
+            def write_header(relative, record):
+                """
+                Writes a file's header and records it, or returns False once
+                the size cap is reached.
+                """
+                nonlocal written
+                header = f"\n\n=== File: {relative.replace('/', os.sep)} ===\n\n".encode()
+                size = len(header) + record["length"]
+                if stats["truncated"] or (max_bytes is not None and written + size > max_bytes):
+                    stats["truncated"] = True
+                    logging.info(f"Skipped file (size cap): {relative}")
+                    return False
+                outfile.write(header)
+                record["offset"] = written + len(header)
+                written += size
+                files[relative] = record
+                stats["files"] += 1
+                return True
+
+            def drain(limit):
+                while len(pending) > limit:
+                    kind, payload = pending.popleft()
+                    if kind == "copy":
+                        relative, record, old_offset = payload
+                        if write_header(relative, record):
+                            old_output.seek(old_offset)
+                            outfile.write(old_output.read(record["length"]))
+                        continue
+                    (relative, path, stat_result), text, digest, error = payload.result()
+                    if error is not None:
+                        logging.info(f"Failed to read {relative}: {error}")
+                        stats["skipped"] += 1
+                        continue
+                    stats["read"] += 1
+                    record = {
+                        "mtime_ns": stat_result.st_mtime_ns,
+                        "size": stat_result.st_size,
+                        "hash": digest,
+                        "length": None,
+                    }
+                    if text is None:
+                        # Remembered so an unchanged binary file is not read again
+                        logging.info(f"Skipped non-text file: {relative}")
+                        files[relative] = record
+                        stats["skipped"] += 1
+                        continue
+                    content = text.encode("utf-8")
+                    record["length"] = len(content)
+                    if write_header(relative, record):
+                        outfile.write(content)
+
+            for item in scan_tree(source_dir, dir_regex, file_regex, skip_paths, use_gitignore):
+                relative, path, stat_result = item
+                old = previous.get(relative)
+                if (
+                    old is not None
+                    and old["mtime_ns"] == stat_result.st_mtime_ns
+                    and old["size"] == stat_result.st_size
+                ):
+                    stats["reused"] += 1
+                    record = {key: old[key] for key in ("mtime_ns", "size", "hash", "length")}
+                    if record["length"] is None:
+                        logging.info(f"Skipped non-text file: {relative}")
+                        files[relative] = record
+                        stats["skipped"] += 1
+                        continue
+                    pending.append(("copy", (relative, record, old["offset"])))
+                else:
+                    pending.append(("read", executor.submit(read_entry, item)))
+                # Keep a bounded window of reads in flight, written in order
+                drain(workers * 4)
+                if stats["truncated"]:
+                    break
+            drain(0)
+    finally:
+        if old_output is not None:
+            old_output.close()
+
+    os.replace(temp_file, output_file)
+    output_stat = os.stat(output_file)
+    with open(manifest_file, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "version": MANIFEST_VERSION,
+                "output_size": output_stat.st_size,
+                "output_mtime_ns": output_stat.st_mtime_ns,
+                "files": files,
+            },
+            file,
+            separators=(",", ":"),
+        )
+    return stats
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Combine directory contents into a single text file, excluding specified directories and files."
@@ -132,31 +496,74 @@ if __name__ == "__main__":
         default="skipped_items.log",
         help="Name of the log file to record skipped files and directories (default: skipped_items.log)",
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Read files in parallel, honor .gitignore and only re-read files changed since the last run",
+    )
+    parser.add_argument(
+        "--max-bytes",
+        type=int,
+        default=None,
+        help="Stop adding files once the output reaches this size (incremental mode only)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of reader threads (incremental mode only)",
+    )
+    parser.add_argument(
+        "--no-gitignore",
+        action="store_true",
+        help="Do not apply .gitignore files (incremental mode only)",
+    )
     args = parser.parse_args()
 
     # Get the directory where the script is located
     script_directory = os.path.dirname(os.path.abspath(__file__))
 
-    # Process ignore directories
-    ignore_dirs = read_ignore_dirs(args.ignore_dirs, script_directory)
+    if args.incremental:
+        output_text_file = os.path.join(script_directory, args.output)
+        log_file = os.path.join(script_directory, args.log)
+        stats = bundle_directory(
+            source_dir=script_directory,
+            output_file=output_text_file,
+            ignore_dirs=args.ignore_dirs,
+            ignore_files=args.ignore_files,
+            max_bytes=args.max_bytes,
+            workers=args.workers,
+            use_gitignore=not args.no_gitignore,
+            log_file=log_file,
+        )
+        print(
+            f"Bundled {stats['files']} files into '{output_text_file}' "
+            f"({stats['read']} read, {stats['reused']} unchanged)"
+        )
+        if stats["truncated"]:
+            print(f"Output reached the {args.max_bytes} byte cap; remaining files were skipped")
+        print(f"Skipped files and directories have been logged to '{log_file}'")
+    else:
+        # Process ignore directories
+        ignore_dirs = read_ignore_dirs(args.ignore_dirs, script_directory)
 
-    # Define the output file path within the script directory
-    output_text_file = os.path.join(script_directory, args.output)
+        # Define the output file path within the script directory
+        output_text_file = os.path.join(script_directory, args.output)
 
-    # Define the log file path within the script directory
-    log_file = os.path.join(script_directory, args.log)
+        # Define the log file path within the script directory
+        log_file = os.path.join(script_directory, args.log)
 
-    # Define ignore files list
-    ignore_files = args.ignore_files
+        # Define ignore files list
+        ignore_files = args.ignore_files
 
-    copy_directory_contents_to_file(
-        source_dir=script_directory,
-        output_file=output_text_file,
-        ignore_dirs=ignore_dirs,
-        ignore_files=ignore_files,
-        log_file=log_file,
-    )
-    print(
-        f"All text files in '{script_directory}' have been combined into '{output_text_file}'"
-    )
-    print(f"Skipped files and directories have been logged to '{log_file}'")
+        copy_directory_contents_to_file(
+            source_dir=script_directory,
+            output_file=output_text_file,
+            ignore_dirs=ignore_dirs,
+            ignore_files=ignore_files,
+            log_file=log_file,
+        )
+        print(
+            f"All text files in '{script_directory}' have been combined into '{output_text_file}'"
+        )
+        print(f"Skipped files and directories have been logged to '{log_file}'")
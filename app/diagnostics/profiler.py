@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict
+
+MAX_PROFILE_SECONDS = 60.0
+MIN_INTERVAL = 0.001
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread from a background thread for a
+    bounded window, so it can run against a live server without
+    instrumenting anything.
+
+    Each sample only records the code objects on each stack; they are turned
+    into labels once at the end. The result is in the folded format
+    ("frame;frame;frame count" per line) read by flamegraph.pl, speedscope
+    and most other flame graph viewers.
+    """
+
+    def __init__(self):
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._labels: Dict[object, str] = {}
+
+    def run(self, seconds: float, interval: float = 0.005) -> str:
+        """
+        Samples for `seconds` and returns the folded profile. Blocks the
+        calling thread; raises ProfilerBusy if a profile is already running.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            counts = self._sample(
+                min(seconds, MAX_PROFILE_SECONDS), max(interval, MIN_INTERVAL)
+            )
+            return self._fold(counts)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float) -> Counter:
+        counts: Counter = Counter()
+        me = threading.get_ident()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                counts[(ident, tuple(stack))] += 1
+            self.samples += 1
+            time.sleep(interval)
+        return counts
+
+    def _fold(self, counts: Counter) -> str:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        folded: Counter = Counter()
+        for (ident, stack), count in counts.items():
+            frames = [names.get(ident, f"thread-{ident}")]
+            frames.extend(self._label(code) for code in reversed(stack))
+            folded[";".join(frames)] += count
+        return "".join(f"{stack} {count}\n" for stack, count in folded.most_common())
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            for prefix in sorted(sys.path, key=len, reverse=True):
+                if prefix and path.startswith(prefix + os.sep):
+                    path = path[len(prefix) + 1 :]
+                    break
+            name = getattr(code, "co_qualname", code.co_name)
+            # Semicolons separate frames in the folded format
+            label = f"{name} ({path}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
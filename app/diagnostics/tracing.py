@@ -0,0 +1,194 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+
+
+class Trace:
+    """
+    Timing of one connect, broadcast or request, split into named stages.
+    """
+
+    __slots__ = ("kind", "name", "started", "duration", "stages", "_open")
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+        self.started = time.time()
+        self.duration = 0.0
+        self.stages: Dict[str, float] = {}
+        self._open: Dict[str, int] = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        stages = {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+        stages["other"] = round(
+            max(self.duration - sum(self.stages.values()), 0.0) * 1000, 2
+        )
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "started": self.started,
+            "duration_ms": round(self.duration * 1000, 2),
+            "stages_ms": stages,
+        }
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Adds the time spent in the block to the current trace's `name` stage.
+    Does nothing outside a trace. Nested blocks of the same stage are only
+    counted once, so a DB query inside a traced snapshot build is not
+    counted twice.
+    """
+    trace = _current.get()
+    if trace is None or trace._open.get(name):
+        yield
+        return
+    trace._open[name] = 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace._open[name] = 0
+        trace.add(name, time.perf_counter() - started)
+
+
+class SlowTraces:
+    """
+    Traces connects, broadcasts and requests, keeping the most recent ones
+    that took longer than `threshold_ms`. A threshold of 0 turns tracing off.
+
+    A trace started inside another (a broadcast triggered by a request)
+    is recorded on its own and also counted as a stage of the outer one.
+    """
+
+    def __init__(self, threshold_ms: float = 250.0, keep: int = 200):
+        self.threshold = threshold_ms / 1000
+        self.traced = 0
+        self.slow = 0
+        self._recent = deque(maxlen=keep)
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    @contextmanager
+    def trace(self, kind: str, name: str):
+        if not self.enabled:
+            yield None
+            return
+        trace = Trace(kind, name)
+        parent = _current.get()
+        token = _current.set(trace)
+        started = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            trace.duration = time.perf_counter() - started
+            _current.reset(token)
+            if parent is not None:
+                parent.add(kind, trace.duration)
+            self.traced += 1
+            if trace.duration >= self.threshold:
+                self.slow += 1
+                self._recent.append(trace)
+
+    def clear(self):
+        self._recent.clear()
+
+    def recent(self, kind: Optional[str] = None, limit: int = 50) -> list:
+        traces = [t for t in reversed(self._recent) if kind is None or t.kind == kind]
+        return [trace.as_dict() for trace in traces[:limit]]
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "traced": self.traced,
+            "slow": self.slow,
+        }
+
+
+def install_db_timing(engine):
+    """
+    Counts every query run on `engine` toward the current trace's "db"
+    stage, including queries run in worker threads on its behalf.
+    """
+    from sqlalchemy import event
+
+    # The start time lives on the statement's execution context, so a query
+    # that raises leaves nothing behind to be paired with the next one
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._trace_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        _record_db(context)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        _record_db(exception_context.execution_context)
+
+
+def _record_db(context):
+    started = getattr(context, "_trace_started", None)
+    if started is None:
+        return
+    del context._trace_started
+    trace = _current.get()
+    if trace is not None and not trace._open.get("db"):
+        trace.add("db", time.perf_counter() - started)
+
+
+def install_serialization_timing():
+    """
+    Counts FastAPI's response serialization (response_model validation and
+    encoding) toward the current trace's "serialization" stage. FastAPI has
+    no event for it, so this wraps fastapi.routing.serialize_response, which
+    its request handlers look up at call time. Rendering a plain dict
+    returned without a response_model still lands in "other".
+    """
+    from fastapi import routing
+
+    serialize_response = routing.serialize_response
+    if getattr(serialize_response, "_traced", False):
+        return
+
+    async def timed_serialize_response(**kwargs):
+        with stage("serialization"):
+            return await serialize_response(**kwargs)
+
+    timed_serialize_response._traced = True
+    routing.serialize_response = timed_serialize_response
+
+
+class SlowRequestMiddleware:
+    """
+    ASGI middleware tracing each HTTP request, with the time spent writing
+    the response counted as its "send" stage. See install_db_timing and
+    install_serialization_timing for the "db" and "serialization" stages.
+    """
+
+    def __init__(self, app, traces: SlowTraces):
+        self.app = app
+        self.traces = traces
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.traces.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        async def timed_send(message):
+            with stage("send"):
+                await send(message)
+
+        with self.traces.trace("request", f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, timed_send)
@@ -0,0 +1,89 @@
+import asyncio
+from typing import List, Optional
+from app.layout.force_layout import ForceLayout
+
+
+class EventLayout:
+    """
+    The server-side layout of one live event.
+
+    The first full simulation runs in a worker thread. Graph changes that
+    arrive meanwhile are queued and applied once it finishes, so the NumPy
+    arrays are never touched from two threads at once.
+    """
+
+    def __init__(self, snapshot: dict):
+        self.layout: Optional[ForceLayout] = None
+        self._snapshot = snapshot
+        self._ready = asyncio.Event()
+        self._pending: List[dict] = []
+        # Bumped whenever positions change, so encoded snapshots can be reused
+        self.revision = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    async def build(self):
+        snapshot, self._snapshot = self._snapshot, None
+        try:
+            self.layout = await asyncio.to_thread(ForceLayout.from_snapshot, snapshot)
+        except Exception as e:
+            print(f"Error building layout: {str(e)}")
+        finally:
+            if self.layout is None:
+                # Unsettled, but still able to place later changes
+                self.layout = ForceLayout.from_snapshot(snapshot, iterations=0)
+            self.revision += 1
+            self._ready.set()
+            pending, self._pending = self._pending, []
+            for message in pending:
+                self.apply(message)
+
+    async def wait_ready(self):
+        await self._ready.wait()
+
+    def apply(self, message: dict):
+        """
+        Adds the message's node or edge to the layout and stamps it with
+        the resulting coordinates.
+        """
+        if not self.ready:
+            self._pending.append(message)
+            return
+
+        message_type = message.get("type")
+        if message_type in ("new_user", "new_connection"):
+            self.revision += 1
+        if message_type == "new_user":
+            user = message.get("user") or {}
+            if not user.get("id"):
+                return
+            self.layout.add_node(user["id"])
+            self.layout.relax([user["id"]])
+            user["x"], user["y"] = self.layout.position(user["id"])
+        elif message_type == "new_connection":
+            data = message.get("data") or {}
+            source, target = data.get("source"), data.get("target")
+            if not source or not target:
+                return
+            placed = {source: self.layout.degree(source), target: self.layout.degree(target)}
+            self.layout.add_edge(source, target)
+            # A node's first edge moves it next to the other end, so it does
+            # not have to be pulled across the graph from where it was added
+            if placed[source] == 0 and placed[target]:
+                self.layout.place_near(source, [target])
+            elif placed[target] == 0 and placed[source]:
+                self.layout.place_near(target, [source])
+            # Relaxing pulls the endpoints' neighbors along, so clients get
+            # every node that moved, not just the two endpoints
+            moved = self.layout.relax([source, target])
+            data["positions"] = {
+                node_id: list(self.layout.position(node_id)) for node_id in moved
+            }
+
+    def annotate_snapshot(self, snapshot: dict):
+        for participant in snapshot["participants"]:
+            position = self.layout.position(participant["id"])
+            if position is not None:
+                participant["x"], participant["y"] = position
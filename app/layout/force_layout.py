@@ -0,0 +1,257 @@
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # server-side layout is optional
+    np = None
+
+LAYOUT_AVAILABLE = np is not None
+
+# Above this many nodes repulsion is approximated with a grid of cell
+# centroids instead of computing every pair.
+DIRECT_LIMIT = 800
+MAX_GRID_SIDE = 48
+NEAR_PAIR_LIMIT = 4_000_000
+
+
+def _accumulate(index, values, size: int):
+    """
+    Sums 2D vectors into `size` rows by index; bincount is much faster than
+    np.add.at for this.
+    """
+    return np.stack(
+        [
+            np.bincount(index, weights=values[:, 0], minlength=size),
+            np.bincount(index, weights=values[:, 1], minlength=size),
+        ],
+        axis=1,
+    )
+
+
+class ForceLayout:
+    """
+    Fruchterman-Reingold style force layout for one event's graph, run with
+    NumPy so each iteration is a handful of array operations.
+
+    Small graphs use exact pairwise repulsion. Larger ones bin nodes into a
+    grid: nodes in the same cell repel exactly, and every other cell acts as
+    a single mass at its centroid, so an iteration costs O(cells^2 + n).
+    New nodes and edges only relax the nodes they touch, so an existing
+    layout stays put while the event grows.
+    """
+
+    def __init__(self, link_distance: float = 50.0, gravity: float = 1.0, seed: int = 0):
+        if np is None:
+            raise RuntimeError("numpy is required for server-side layout")
+        self.k = link_distance
+        self.gravity = gravity
+        self.rng = np.random.default_rng(seed)
+        self.index: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.adjacency: List[List[int]] = []
+        self._positions = np.zeros((16, 2))
+        self._sources: List[int] = []
+        self._targets: List[int] = []
+        self._edges = None
+        self._edge_set = set()
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict, iterations: Optional[int] = None) -> "ForceLayout":
+        """
+        Lays out a whole event snapshot. Large graphs get fewer iterations,
+        since each one costs more and the grid approximation is coarser.
+        """
+        layout = cls()
+        for participant in snapshot["participants"]:
+            layout.add_node(participant["id"])
+        for connection in snapshot["connections"]:
+            layout.add_edge(connection["source"], connection["target"])
+        if iterations is None:
+            iterations = 60 if len(layout) <= DIRECT_LIMIT else 30
+        layout.settle(iterations)
+        return layout
+
+    @property
+    def positions(self):
+        return self._positions[: len(self.ids)]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add_node(self, node_id: str) -> int:
+        if node_id in self.index:
+            return self.index[node_id]
+        count = len(self.ids)
+        if count == self._positions.shape[0]:
+            grown = np.zeros((count * 2, 2))
+            grown[:count] = self._positions
+            self._positions = grown
+        radius = self.k * math.sqrt(count + 1) / 2
+        angle = self.rng.uniform(0, 2 * math.pi)
+        self._positions[count] = (radius * math.cos(angle), radius * math.sin(angle))
+        self.index[node_id] = count
+        self.ids.append(node_id)
+        self.adjacency.append([])
+        return count
+
+    def add_edge(self, source: str, target: str):
+        a = self.add_node(source)
+        b = self.add_node(target)
+        if a == b or (min(a, b), max(a, b)) in self._edge_set:
+            return
+        self._edge_set.add((min(a, b), max(a, b)))
+        self._sources.append(a)
+        self._targets.append(b)
+        self.adjacency[a].append(b)
+        self.adjacency[b].append(a)
+        self._edges = None
+
+    def degree(self, node_id: str) -> int:
+        i = self.index.get(node_id)
+        return 0 if i is None else len(self.adjacency[i])
+
+    def place_near(self, node_id: str, neighbors: Iterable[str]):
+        """
+        Moves a freshly added node next to the centroid of its neighbors.
+        """
+        indices = [self.index[n] for n in neighbors if n in self.index and n != node_id]
+        if not indices:
+            return
+        center = self.positions[indices].mean(axis=0)
+        self._positions[self.index[node_id]] = center + self.rng.normal(0, self.k / 4, 2)
+
+    def position(self, node_id: str) -> Optional[Tuple[float, float]]:
+        i = self.index.get(node_id)
+        if i is None:
+            return None
+        x, y = self._positions[i]
+        return round(float(x), 1), round(float(y), 1)
+
+    def settle(self, iterations: int, temperature: Optional[float] = None):
+        """
+        Runs the full simulation, cooling linearly from `temperature`.
+        """
+        if len(self.ids) < 2:
+            return
+        temperature = temperature or self.k * math.sqrt(len(self.ids))
+        for i in range(iterations):
+            self._step(None, temperature * (1 - i / iterations) + 1)
+
+    def relax(self, node_ids: Iterable[str], iterations: int = 10) -> List[str]:
+        """
+        Moves only the given nodes and their direct neighbors, leaving the
+        rest of the layout untouched. Returns the ids of the nodes it moved.
+        """
+        active = set()
+        for node_id in node_ids:
+            i = self.index.get(node_id)
+            if i is not None:
+                active.add(i)
+                active.update(self.adjacency[i])
+        if not active or len(self.ids) < 2:
+            return []
+        active = np.fromiter(sorted(active), dtype=np.intp)
+        sources, targets = self._edge_arrays()
+        touching = np.isin(sources, active) | np.isin(targets, active)
+        edges = (sources[touching], targets[touching])
+        for i in range(iterations):
+            self._step(active, self.k / 2 * (1 - i / iterations) + 1, edges)
+        return [self.ids[i] for i in active]
+
+    def _edge_arrays(self):
+        if self._edges is None:
+            self._edges = (
+                np.asarray(self._sources, dtype=np.intp),
+                np.asarray(self._targets, dtype=np.intp),
+            )
+        return self._edges
+
+    def _repulsion(self, nodes):
+        positions = self.positions
+        rows = positions[nodes]
+        k2 = self.k * self.k
+        if len(positions) <= DIRECT_LIMIT:
+            delta = rows[:, None, :] - positions[None, :, :]
+            dist2 = np.einsum("ijk,ijk->ij", delta, delta)
+            # A node's zero distance to itself contributes nothing
+            weights = np.divide(k2, dist2, out=np.zeros_like(dist2), where=dist2 > 1e-9)
+            return np.einsum("ijk,ij->ik", delta, weights)
+
+        side = min(MAX_GRID_SIDE, max(4, int(math.sqrt(len(positions)) / 3)))
+        low = positions.min(axis=0)
+        span = np.maximum(positions.max(axis=0) - low, 1e-9)
+        cells = np.minimum((positions - low) / (span / side), side - 1).astype(np.intp)
+        flat = cells[:, 0] * side + cells[:, 1]
+        counts = np.bincount(flat, minlength=side * side)
+        occupied = counts > 0
+        mass = counts[occupied]
+        column = np.cumsum(occupied) - 1
+        centroids = np.stack(
+            [
+                np.bincount(flat, weights=positions[:, 0], minlength=side * side)[occupied],
+                np.bincount(flat, weights=positions[:, 1], minlength=side * side)[occupied],
+            ],
+            axis=1,
+        ) / mass[:, None]
+
+        # Far field: other cells act as one mass at their centroid. A full
+        # step computes that once per cell and shares it with the cell's
+        # nodes; a small relax computes it per node.
+        if len(nodes) < len(centroids):
+            targets = rows
+            own = column[flat[nodes]]
+        else:
+            targets = centroids
+            own = np.arange(len(centroids))
+        delta = targets[:, None, :] - centroids[None, :, :]
+        dist2 = np.einsum("ijk,ijk->ij", delta, delta)
+        weights = np.divide(
+            k2 * mass[None, :], dist2, out=np.zeros_like(dist2), where=dist2 > 1e-9
+        )
+        weights[np.arange(len(targets)), own] = 0
+        field = np.einsum("ijk,ij->ik", delta, weights)
+        forces = field if targets is rows else field[column[flat[nodes]]]
+
+        # Near field: exact pairs with the nodes sharing each row's cell
+        order = np.argsort(flat, kind="stable")
+        starts = np.cumsum(counts) - counts
+        row_cells = flat[nodes]
+        partners = counts[row_cells]
+        total = int(partners.sum())
+        if total > NEAR_PAIR_LIMIT:
+            return forces
+        row = np.repeat(np.arange(len(nodes)), partners)
+        offset = np.arange(total) - np.repeat(np.cumsum(partners) - partners, partners)
+        other = order[np.repeat(starts[row_cells], partners) + offset]
+        delta = rows[row] - positions[other]
+        dist2 = np.einsum("ij,ij->i", delta, delta)
+        weights = np.divide(k2, dist2, out=np.zeros_like(dist2), where=dist2 > 1e-9)
+        push = delta * weights[:, None]
+        forces += _accumulate(row, push, len(nodes))
+        return forces
+
+    def _step(self, active, temperature: float, edges=None):
+        positions = self.positions
+        nodes = np.arange(len(positions)) if active is None else active
+        rows = positions[nodes]
+        displacement = self._repulsion(nodes)
+
+        # Springs along edges, accumulated for every node then sliced
+        sources, targets = edges if edges is not None else self._edge_arrays()
+        if len(sources):
+            delta = positions[targets] - positions[sources]
+            dist = np.sqrt(np.einsum("ij,ij->i", delta, delta)) + 1e-9
+            pull = delta * (dist / self.k)[:, None]
+            attraction = _accumulate(sources, pull, len(positions)) - _accumulate(
+                targets, pull, len(positions)
+            )
+            displacement += attraction if active is None else attraction[active]
+
+        displacement -= self.gravity * rows
+        length = np.sqrt(np.einsum("ij,ij->i", displacement, displacement)) + 1e-9
+        moved = rows + displacement * (np.minimum(length, temperature) / length)[:, None]
+        if active is None:
+            self._positions[: len(positions)] = moved
+        else:
+            self._positions[active] = moved
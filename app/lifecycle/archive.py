@@ -0,0 +1,189 @@
+import gzip
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from app.models import models
+
+ARCHIVE_FORMAT = 1
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[int]:
+    return int(value.timestamp()) if value is not None else None
+
+
+def _index(values: List, positions: Dict, value) -> int:
+    position = positions.get(value)
+    if position is None:
+        position = positions[value] = len(values)
+        values.append(value)
+    return position
+
+
+def encode_graph(event: models.Event, participants: List, connections: List) -> bytes:
+    """
+    Packs an event's graph into gzipped JSON. Users are stored once in a
+    list, participants first, and connections refer to them by position;
+    roles and statuses are stored once and referred to by position too.
+
+        {"v": 1, "event": {...}, "roles": [...], "statuses": [...],
+         "participants": n,
+         "users": [[id, name, role, profile, joined_at], ...],
+         "connections": [[user, user, status, created_at], ...]}
+
+    `participants` are (EventParticipant, User) rows, `connections` are
+    Connection rows; times are Unix seconds.
+    """
+    roles: List = []
+    statuses: List = []
+    role_positions: Dict = {}
+    status_positions: Dict = {}
+    users: List[list] = []
+    user_positions: Dict[str, int] = {}
+
+    for participant, user in participants:
+        user_positions[user.id] = len(users)
+        users.append(
+            [
+                user.id,
+                user.name,
+                _index(roles, role_positions, participant.role),
+                user.profile,
+                _timestamp(participant.joined_at),
+            ]
+        )
+    participant_count = len(users)
+
+    rows = []
+    for connection in connections:
+        ends = []
+        for user_id in (connection.user_id_1, connection.user_id_2):
+            # Connections may name users who never joined the event
+            if user_id not in user_positions:
+                user_positions[user_id] = len(users)
+                users.append([user_id, None, None, None, None])
+            ends.append(user_positions[user_id])
+        rows.append(
+            [
+                *ends,
+                _index(statuses, status_positions, connection.status),
+                _timestamp(connection.created_at),
+            ]
+        )
+
+    document = {
+        "v": ARCHIVE_FORMAT,
+        "event": {
+            "id": event.id,
+            "name": event.name,
+            "start_date": _timestamp(event.start_date),
+            "end_date": _timestamp(event.end_date),
+        },
+        "roles": roles,
+        "statuses": statuses,
+        "participants": participant_count,
+        "users": users,
+        "connections": rows,
+    }
+    payload = json.dumps(document, separators=(",", ":"), default=str).encode()
+    return gzip.compress(payload, compresslevel=9, mtime=0)
+
+
+def decode_graph(data: bytes) -> dict:
+    """
+    Expands an archived graph into the same shape as a live event snapshot.
+    """
+    document = json.loads(gzip.decompress(data))
+    if document.get("v") != ARCHIVE_FORMAT:
+        raise ValueError(f"Unsupported archive format: {document.get('v')}")
+    users = document["users"]
+    roles = document["roles"]
+    statuses = document["statuses"]
+    return {
+        "event": {
+            "id": document["event"]["id"],
+            "name": document["event"]["name"],
+            "type": "event",
+            "archived": True,
+        },
+        "participants": [
+            {"id": user_id, "name": name, "role": roles[role], "profile": profile}
+            for user_id, name, role, profile, _ in users[: document["participants"]]
+        ],
+        "connections": [
+            {"source": users[a][0], "target": users[b][0], "status": statuses[status]}
+            for a, b, status, _ in document["connections"]
+        ],
+    }
+
+
+def archive_event(db: Session, event_id: str) -> Optional[models.EventArchive]:
+    """
+    Moves an ended event's participant and connection rows to the archive
+    tables and stores its packed graph, in one transaction. Returns None if
+    the event does not exist or is already archived.
+
+    The event row is locked first. Writers take a shared lock on it (see
+    check_not_archived in main.py) before adding rows, so no participant or
+    connection can be committed between the copy and the delete below.
+    """
+    event = (
+        db.query(models.Event)
+        .filter(models.Event.id == event_id)
+        .with_for_update()
+        .first()
+    )
+    if event is None or event.archived_at is not None:
+        return None
+
+    participants = (
+        db.query(models.EventParticipant, models.User)
+        .join(models.User, models.EventParticipant.user_id == models.User.id)
+        .filter(models.EventParticipant.event_id == event_id)
+        .order_by(models.EventParticipant.id)
+        .all()
+    )
+    connections = (
+        db.query(models.Connection)
+        .filter(models.Connection.event_id == event_id)
+        .order_by(models.Connection.id)
+        .all()
+    )
+    data = encode_graph(event, participants, connections)
+
+    for hot, cold in (
+        (models.EventParticipant, models.ArchivedEventParticipant),
+        (models.Connection, models.ArchivedConnection),
+    ):
+        columns = [column.name for column in cold.__table__.columns]
+        db.execute(
+            insert(cold.__table__).from_select(
+                columns,
+                select(*[hot.__table__.c[name] for name in columns]).where(
+                    hot.__table__.c.event_id == event_id
+                ),
+            )
+        )
+        db.execute(delete(hot.__table__).where(hot.__table__.c.event_id == event_id))
+
+    archive = models.EventArchive(
+        event_id=event_id,
+        format_version=ARCHIVE_FORMAT,
+        participants=len(participants),
+        connections=len(connections),
+        data=data,
+    )
+    db.add(archive)
+    event.status = "ended"
+    event.archived_at = datetime.now(timezone.utc)
+    db.commit()
+    return archive
+
+
+def load_archive(db: Session, event_id: str) -> Optional[models.EventArchive]:
+    return (
+        db.query(models.EventArchive)
+        .filter(models.EventArchive.event_id == event_id)
+        .first()
+    )
@@ -0,0 +1,132 @@
+import asyncio
+from typing import List, Optional
+from app.caching.versions import ResourceVersions, events_key, graph_key
+from app.database.database import SessionLocal
+from app.lifecycle.archive import archive_event
+from app.models import models
+from app.search.participant_index import ParticipantSearch
+from app.websockets.connection_manager import ConnectionManager
+from app.websockets.message_log import MessageLog
+from app.websockets.sharding import ShardRouter
+
+EVENT_ENDED_CLOSE_CODE = 4410
+
+
+class EventArchiver:
+    """
+    Lifecycle job for ended events.
+
+    Every `interval` seconds, events with status "ended" have their rows
+    moved to the archive tables, and any state this process still holds
+    for them is dropped: sockets are closed with 4410, and routing, layout,
+    snapshot, search and message log state are released. Each worker evicts its
+    own state, so events archived by another shard are cleaned up too. The
+    version bumps go to the other shards through `router`, when sharding is on.
+    """
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        versions: ResourceVersions,
+        message_log: Optional[MessageLog] = None,
+        interval: float = 300.0,
+        search: Optional[ParticipantSearch] = None,
+        router: Optional[ShardRouter] = None,
+    ):
+        self.manager = manager
+        self.versions = versions
+        self.message_log = message_log
+        self.search = search
+        self.router = router
+        self.interval = interval
+        self.archived = 0
+        self.evicted = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Error archiving events: {str(e)}")
+
+    async def sweep(self) -> List[str]:
+        """
+        Archives every ended event and evicts those held in memory. Returns
+        the ids archived by this call.
+        """
+        local = set(self.manager.state.event_ids()) | set(self.manager.snapshots.event_ids())
+        if self.search is not None:
+            local.update(self.search.event_ids())
+        pending, ended_local = await asyncio.to_thread(self._find_ended, local)
+        archived = []
+        for event_id in pending:
+            if await self.archive(event_id):
+                archived.append(event_id)
+        for event_id in ended_local:
+            await self.evict(event_id)
+        return archived
+
+    def _find_ended(self, local: set):
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(models.Event.id, models.Event.archived_at)
+                .filter(models.Event.status == "ended")
+                .all()
+            )
+        finally:
+            db.close()
+        pending = [event_id for event_id, archived_at in rows if archived_at is None]
+        ended_local = [event_id for event_id, _ in rows if event_id in local]
+        return pending, ended_local
+
+    async def archive(self, event_id: str) -> bool:
+        archived = await asyncio.to_thread(self._archive, event_id)
+        if archived:
+            self.archived += 1
+            print(f"Archived event {event_id}")  # Debug line
+            # The graph is now served from the archive, and the event list
+            # shows its archived status
+            bump = (graph_key(event_id), events_key())
+            self.versions.bump(*bump)
+            if self.router is not None:
+                await self.router.sync(bump)
+            await self.evict(event_id)
+        return archived
+
+    def _archive(self, event_id: str) -> bool:
+        db = SessionLocal()
+        try:
+            return archive_event(db, event_id) is not None
+        except Exception as e:
+            # Another worker archiving the same event fails on the archive keys
+            db.rollback()
+            print(f"Error archiving event {event_id}: {str(e)}")
+            return False
+        finally:
+            db.close()
+
+    async def evict(self, event_id: str):
+        if self.manager.state.has_event(event_id) or event_id in self.manager.routing:
+            self.evicted += 1
+        await self.manager.evict_event(
+            event_id, code=EVENT_ENDED_CLOSE_CODE, reason="Event ended"
+        )
+        if self.message_log is not None:
+            self.message_log.forget(event_id)
+        if self.search is not None:
+            self.search.forget(event_id)
+
+    def stats(self) -> dict:
+        return {"interval": self.interval, "archived": self.archived, "evicted": self.evicted}
@@ -1,17 +1,112 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends
+from fastapi import (
+    FastAPI,
+    WebSocket,
+    WebSocketDisconnect,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from app.websockets.connection_manager import ConnectionManager
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from .database.database import get_db
+from .database.database import engine, get_db
 from .models import models
 from .schemas import schemas
+from .analytics.rollups import (
+    ActivityBucket,
+    ActivityRollups,
+    BUCKET_SECONDS,
+    bucket_datetime,
+    current_bucket,
+)
+from .caching.static_files import PrecompressedStaticFiles, accepted_encodings
+from .caching.versions import (
+    ResourceVersions,
+    users_key,
+    user_key,
+    events_key,
+    graph_key,
+    participants_key,
+)
+from .diagnostics.profiler import ProfilerBusy, SamplingProfiler
+from .diagnostics.tracing import (
+    SlowRequestMiddleware,
+    SlowTraces,
+    install_db_timing,
+    install_serialization_timing,
+)
+from .layout.force_layout import LAYOUT_AVAILABLE
+from .lifecycle.archive import load_archive
+from .lifecycle.archiver import EventArchiver
+from .search.participant_index import ParticipantSearch
+from .websockets.admission import AdmissionControl, AdmissionRejected
+from .websockets.heartbeat import Heartbeat
+from .websockets.message_log import MessageLog
+from .websockets.sharding import ShardRouter, parse_peers
+from .websockets.subscriptions import GRAPH_MESSAGE_TYPES
+from .websockets.snapshots import SnapshotCache, copy_for_client, encode_snapshot
+import asyncio
+import gzip
+import hmac
+import json
+import os
 import uuid
+from typing import Optional
 
 app = FastAPI(title="Nodiverse")
-manager = ConnectionManager()
-app.mount("/static", StaticFiles(directory="static"), name="static")
+message_log = MessageLog(os.getenv("MESSAGE_LOG_DIR", "message_logs"))
+rollups = ActivityRollups(float(os.getenv("ROLLUP_FLUSH_INTERVAL", "10")))
+versions = ResourceVersions()
+# Connects, broadcasts and requests slower than this are kept for /admin/traces
+traces = SlowTraces(
+    float(os.getenv("TRACE_THRESHOLD_MS", "250")), keep=int(os.getenv("TRACE_KEEP", "200"))
+)
+profiler = SamplingProfiler()
+install_db_timing(engine)
+install_serialization_timing()
+admission = AdmissionControl(
+    max_concurrent=int(os.getenv("WS_MAX_HANDSHAKES", "64")),
+    max_queue=int(os.getenv("WS_HANDSHAKE_QUEUE", "1024")),
+    timeout=float(os.getenv("WS_HANDSHAKE_TIMEOUT", "10")),
+)
+manager = ConnectionManager(
+    message_log=message_log,
+    rollups=rollups,
+    server_layout=LAYOUT_AVAILABLE and os.getenv("SERVER_LAYOUT", "1") == "1",
+    snapshots=SnapshotCache(versions),
+    traces=traces,
+    admission=admission,
+)
+heartbeat = Heartbeat(
+    manager,
+    interval=float(os.getenv("WS_PING_INTERVAL", "20")),
+    timeout=float(os.getenv("WS_PING_TIMEOUT", "60")),
+)
+search = ParticipantSearch(manager.snapshots, versions)
+# Event-affinity sharding is enabled by giving each worker its SHARD_ID and
+# the same SHARD_PEERS list, e.g. "w1=http://127.0.0.1:8001,w2=http://127.0.0.1:8002".
+router = (
+    ShardRouter(
+        os.environ["SHARD_ID"],
+        parse_peers(os.environ["SHARD_PEERS"]),
+        os.getenv("SHARD_SECRET", ""),  # Required; startup fails without it
+    )
+    if os.getenv("SHARD_PEERS")
+    else None
+)
+archiver = EventArchiver(
+    manager,
+    versions,
+    message_log=message_log,
+    search=search,
+    interval=float(os.getenv("ARCHIVE_INTERVAL", "300")),
+    router=router,
+)
+# Run `python -m app.caching.static_files app/static` after a frontend build
+# to write the .br/.gz variants served here
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 # CORS setup for development
 app.add_middleware(
     CORSMiddleware,
@@ -20,11 +115,38 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(SlowRequestMiddleware, traces=traces)
+
+
+@app.on_event("startup")
+async def startup():
+    rollups.start()
+    heartbeat.start()
+    archiver.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await heartbeat.close()
+    await archiver.close()
+    await message_log.close()
+    await rollups.close()
 
 
 @app.websocket("/ws/{event_id}/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, event_id: str, user_id: str):
-    connected = await manager.connect(websocket, user_id, event_id)
+    if router is not None and not router.owns(event_id):
+        # Tell the client which shard to reconnect to
+        await websocket.accept()
+        await websocket.close(code=4009, reason=router.websocket_url(event_id, user_id))
+        return
+
+    try:
+        connected = await manager.connect(websocket, user_id, event_id)
+    except AdmissionRejected as e:
+        print(f"Handshake rejected for {user_id}: {str(e)}")
+        await websocket.close(code=1013)  # Try again later
+        return
     if not connected:
         await websocket.close(code=4004)
         return
@@ -32,16 +154,129 @@ async def websocket_endpoint(websocket: WebSocket, event_id: str, user_id: str):
     try:
         while True:
             data = await websocket.receive_json()
+            manager.state.touch(user_id)
+            if data.get("type") == "pong":
+                continue
+            if data.get("type") == "subscribe":
+                try:
+                    scope = manager.subscribe(
+                        event_id, user_id, {} if data.get("data") is None else data["data"]
+                    )
+                except ValueError as e:
+                    await websocket.send_json({"type": "error", "data": {"detail": str(e)}})
+                    continue
+                await websocket.send_json({"type": "subscribed", "data": scope})
+                continue
+            if data.get("type") in GRAPH_MESSAGE_TYPES:
+                # Graph changes only come from the REST writes
+                await websocket.send_json(
+                    {"type": "error", "data": {"detail": f"{data.get('type')} is sent by the server"}}
+                )
+                continue
             await manager.broadcast_to_event(
                 event_id,
                 {"type": data.get("type"), "data": data.get("data"), "sender": user_id},
             )
     except WebSocketDisconnect:
-        await manager.disconnect(user_id, event_id)
+        pass
+    finally:
+        # Whatever ended the loop, the socket must not stay registered
+        await manager.disconnect(user_id, event_id, websocket)
+
+
+async def publish(
+    bump: tuple = (), event_id: Optional[str] = None, message: Optional[dict] = None
+):
+    """
+    Applies a write's version bumps and broadcast locally, and shares them
+    with the other shards when sharding is enabled.
+    """
+    versions.bump(*bump)
+    if message is not None and (router is None or router.owns(event_id)):
+        await manager.broadcast_to_event(event_id, message, graph_write=True)
+        if router is not None:
+            message = None
+    if router is not None:
+        await router.sync(bump, event_id, message)
+
+
+def check_shard_secret(request: Request):
+    if router is None:
+        raise HTTPException(status_code=404, detail="Sharding is not enabled")
+    secret = request.headers.get("x-shard-secret", "")
+    if not hmac.compare_digest(secret, router.secret):
+        raise HTTPException(status_code=403, detail="Invalid shard secret")
+
+
+def check_admin(request: Request):
+    admin_token = os.getenv("ADMIN_TOKEN", "")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Admin endpoints are not enabled")
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token, admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def check_not_archived(db: Session, event_id: str):
+    # Held until the write commits, so archive_event cannot move the
+    # event's rows out from under it
+    event = (
+        db.query(models.Event)
+        .filter(models.Event.id == event_id)
+        .with_for_update(read=True)
+        .first()
+    )
+    if event is not None and event.archived_at is not None:
+        raise HTTPException(status_code=409, detail="Event has ended and is archived")
+
+
+def save(db: Session, row):
+    """
+    Commits a new row and reloads it. Async handlers run this in a worker
+    thread so the blocking DB calls stay off the event loop.
+    """
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+    return row
+
+
+def save_unless_archived(db: Session, event_id: str, row):
+    """
+    Saves a row for an event under check_not_archived's lock. Lock, insert
+    and commit run together in one worker thread, since waiting out an
+    archive's FOR UPDATE on the event loop would stall every other request.
+    """
+    check_not_archived(db, event_id)
+    return save(db, row)
+
+
+def check_same_event(event_id: str, body_event_id: str):
+    if body_event_id != event_id:
+        raise HTTPException(
+            status_code=400, detail="event_id in the body does not match the URL"
+        )
+
+
+def check_not_modified(
+    request: Request, response: Response, key: str
+) -> Optional[Response]:
+    """
+    Stamps the response with the resource's current ETag and returns a 304
+    if the client already holds that version. The ETag is read before any
+    query runs, so a write racing with the read can only make the client
+    refetch, never keep stale data.
+    """
+    etag = versions.etag(key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if versions.matches(etag, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
 
 
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = models.User(
         id=str(uuid.uuid4()),
         name=user.name,
@@ -49,14 +284,13 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         role=user.role,
         profile=user.profile,
     )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await asyncio.to_thread(save, db, db_user)
+    await publish(bump=(users_key(), user_key(db_user.id)))
     return db_user
 
 
 @app.post("/events/", response_model=schemas.Event)
-def create_event(event: schemas.EventCreate, db: Session = Depends(get_db)):
+async def create_event(event: schemas.EventCreate, db: Session = Depends(get_db)):
     db_event = models.Event(
         id=str(uuid.uuid4()),
         name=event.name,
@@ -64,26 +298,36 @@ def create_event(event: schemas.EventCreate, db: Session = Depends(get_db)):
         end_date=event.end_date,
         status=event.status,
     )
-    db.add(db_event)
-    db.commit()
-    db.refresh(db_event)
+    await asyncio.to_thread(save, db, db_event)
+    await publish(bump=(events_key(),))
     return db_event
 
 
 @app.get("/users/", response_model=list[schemas.User])
-def get_users(db: Session = Depends(get_db)):
+def get_users(request: Request, response: Response, db: Session = Depends(get_db)):
+    not_modified = check_not_modified(request, response, users_key())
+    if not_modified:
+        return not_modified
     users = db.query(models.User).all()
     return users
 
 
 @app.get("/events/", response_model=list[schemas.Event])
-def get_events(db: Session = Depends(get_db)):
+def get_events(request: Request, response: Response, db: Session = Depends(get_db)):
+    not_modified = check_not_modified(request, response, events_key())
+    if not_modified:
+        return not_modified
     events = db.query(models.Event).all()
     return events
 
 
 @app.get("/users/{user_id}", response_model=schemas.User)
-def get_user(user_id: str, db: Session = Depends(get_db)):
+def get_user(
+    user_id: str, request: Request, response: Response, db: Session = Depends(get_db)
+):
+    not_modified = check_not_modified(request, response, user_key(user_id))
+    if not_modified:
+        return not_modified
     user = db.query(models.User).filter(models.User.id == user_id).first()
     return user
 
@@ -94,32 +338,295 @@ async def add_participant(
     participant: schemas.EventParticipantCreate,
     db: Session = Depends(get_db),
 ):
+    check_same_event(event_id, participant.event_id)
     db_participant = models.EventParticipant(**participant.dict())
-    db.add(db_participant)
-    db.commit()
-    db.refresh(db_participant)
+    await asyncio.to_thread(save_unless_archived, db, event_id, db_participant)
+    rollups.record_join(event_id)
 
     # Fetch the user details to send in the WebSocket broadcast
-    user = db.query(models.User).filter(models.User.id == participant.user_id).first()
+    user = await asyncio.to_thread(db.get, models.User, participant.user_id)
 
+    message = None
     if user:
         # Notify all WebSocket clients about the new participant
-        await manager.broadcast_to_event(
-            event_id,
-            {
-                "type": "new_user",
-                "user": {
-                    "id": user.id,
-                    "name": user.name,
-                    "role": user.role,
-                    "profile": user.profile,
-                },
+        message = {
+            "type": "new_user",
+            "user": {
+                "id": user.id,
+                "name": user.name,
+                "role": user.role,
+                "profile": user.profile,
             },
-        )
+        }
+        search.add(event_id, message["user"], participant.role)
+    await publish(
+        bump=(graph_key(event_id), participants_key(event_id)),
+        event_id=event_id,
+        message=message,
+    )
 
     return db_participant
 
 
+@app.get("/events/{event_id}/participants/search")
+async def search_participants(
+    event_id: str,
+    q: str,
+    limit: int = 20,
+    fuzzy: bool = True,
+    role: Optional[str] = None,
+):
+    """
+    Finds an event's participants by name or profile words, matching each
+    query word by prefix and, with `fuzzy`, by trigram similarity.
+    """
+    index = await search.get(event_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return {
+        "query": q,
+        "results": index.search(q, limit=max(1, min(limit, 100)), fuzzy=fuzzy, role=role),
+    }
+
+
+@app.get("/events/{event_id}/graph")
+async def get_event_graph(event_id: str, request: Request, response: Response):
+    not_modified = check_not_modified(request, response, graph_key(event_id))
+    if not_modified:
+        return not_modified
+    cached = await manager.snapshots.get(event_id)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    snapshot = copy_for_client(cached.data)
+    await manager.layout_snapshot(event_id, snapshot, cached.version)
+    return Response(
+        encode_snapshot(snapshot, cached.profiles),
+        media_type="application/json",
+        headers={
+            "ETag": response.headers["etag"],
+            "Cache-Control": response.headers["cache-control"],
+        },
+    )
+
+
+@app.post("/events/{event_id}/connections", response_model=schemas.Connection)
+async def create_connection(
+    event_id: str,
+    connection: schemas.ConnectionCreate,
+    db: Session = Depends(get_db),
+):
+    check_same_event(event_id, connection.event_id)
+    db_connection = models.Connection(**connection.dict())
+    await asyncio.to_thread(save_unless_archived, db, event_id, db_connection)
+    rollups.record_connection(event_id)
+
+    await publish(
+        bump=(graph_key(event_id),),
+        event_id=event_id,
+        message={
+            "type": "new_connection",
+            "data": {
+                "source": db_connection.user_id_1,
+                "target": db_connection.user_id_2,
+                "status": db_connection.status,
+            },
+        },
+    )
+
+    return db_connection
+
+
+@app.get("/events/{event_id}/archive")
+def get_event_archive(
+    event_id: str, request: Request, response: Response, db: Session = Depends(get_db)
+):
+    """
+    Returns an archived event's packed graph (see app/lifecycle/archive.py)
+    as gzipped JSON, decompressed here only for clients that cannot take gzip.
+    """
+    not_modified = check_not_modified(request, response, graph_key(event_id))
+    if not_modified:
+        return not_modified
+    archive = load_archive(db, event_id)
+    if archive is None:
+        raise HTTPException(status_code=404, detail="Event is not archived")
+    headers = {
+        "ETag": response.headers["etag"],
+        "Cache-Control": response.headers["cache-control"],
+        "Vary": "Accept-Encoding",
+    }
+    if "gzip" in accepted_encodings(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        return Response(archive.data, media_type="application/json", headers=headers)
+    return Response(
+        gzip.decompress(archive.data), media_type="application/json", headers=headers
+    )
+
+
+@app.post("/admin/archive")
+async def archive_ended_events(request: Request):
+    check_admin(request)
+    archived = await archiver.sweep()
+    return {**archiver.stats(), "archived_events": archived}
+
+
+@app.get("/events/{event_id}/replay")
+async def replay_event(
+    event_id: str,
+    since: Optional[float] = None,
+    from_seq: Optional[int] = None,
+    speed: float = 1.0,
+    max_gap: float = 5.0,
+):
+    """
+    Streams an event's broadcast history as NDJSON, starting at a unix
+    timestamp or sequence number. `speed` scales the original pacing
+    (0 replays as fast as possible) and `max_gap` caps any single pause.
+    """
+    if speed < 0 or max_gap < 0:
+        raise HTTPException(status_code=400, detail="speed and max_gap must be >= 0")
+    try:
+        message_log.paths(event_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Event not found")
+
+    async def stream():
+        previous = None
+        for seq, timestamp, message in message_log.read(
+            event_id, since=since, from_seq=from_seq
+        ):
+            if speed > 0 and previous is not None and timestamp > previous:
+                await asyncio.sleep(min((timestamp - previous) / speed, max_gap))
+            previous = timestamp
+            yield json.dumps({"seq": seq, "timestamp": timestamp, "message": message}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/events/{event_id}/activity", response_model=list[schemas.EventActivity])
+def get_event_activity(
+    event_id: str, minutes: int = 60, db: Session = Depends(get_db)
+):
+    """
+    Returns the event's per-minute activity for the last `minutes` minutes,
+    including counts that have not been flushed to the database yet.
+    """
+    if minutes < 1:
+        raise HTTPException(status_code=400, detail="minutes must be >= 1")
+    start = current_bucket() - (minutes - 1) * BUCKET_SECONDS
+    pending = rollups.pending_for(event_id)
+
+    flushed = (
+        db.query(models.EventActivity)
+        .filter(
+            models.EventActivity.event_id == event_id,
+            models.EventActivity.bucket_start >= bucket_datetime(start),
+        )
+        .order_by(models.EventActivity.bucket_start)
+        .all()
+    )
+
+    series = {}
+    for row in flushed:
+        bucket = ActivityBucket(row.active_sockets)
+        bucket.joins = row.joins
+        bucket.connections_made = row.connections_made
+        bucket.messages = row.messages
+        series[int(row.bucket_start.timestamp())] = bucket
+    for key, counts in pending.items():
+        if key >= start:
+            series.setdefault(key, ActivityBucket()).merge(counts)
+
+    return [series[key].as_dict(key) for key in sorted(series)]
+
+
+@app.get("/events/{event_id}/route")
+def get_event_route(event_id: str):
+    """
+    Returns the shard that owns the event's sockets, so clients and a local
+    proxy can connect to it directly.
+    """
+    if router is None:
+        return {"shard": None, "url": None}
+    return {"shard": router.owner(event_id), "url": router.owner_url(event_id)}
+
+
+@app.post("/internal/shard-sync")
+async def shard_sync(payload: dict, request: Request):
+    check_shard_secret(request)
+    if payload.get("resync"):
+        # The sender failed to reach us before; any of our ETags may be stale
+        versions.rotate_epoch()
+    versions.bump(*payload.get("bump", []))
+    event_id = payload.get("event_id")
+    if event_id is not None and payload.get("message") is not None:
+        # Forwarded from another shard's publish
+        await manager.broadcast_to_event(event_id, payload["message"], graph_write=True)
+    return {"ok": True}
+
+
+@app.post("/internal/shards")
+async def rebalance_shards(payload: dict, request: Request):
+    """
+    Replaces the peer list (e.g. after adding a worker) and closes sockets
+    for events this shard no longer owns, pointing clients at the new owner.
+    """
+    check_shard_secret(request)
+    router.set_peers(parse_peers(payload["peers"]))
+    moved = [
+        event_id
+        for event_id in manager.state.event_ids()
+        if not router.owns(event_id)
+    ]
+    for event_id in moved:
+        await manager.evict_event(
+            event_id,
+            code=4009,
+            reason=lambda user_id: router.websocket_url(event_id, user_id),
+        )
+    return {"shard": router.shard_id, "moved_events": moved}
+
+
+@app.get("/realtime/stats")
+def get_realtime_stats():
+    return {
+        "sockets": manager.state.socket_count(),
+        "events": len(manager.state.members),
+        "heartbeat": heartbeat.stats(),
+        "archiver": archiver.stats(),
+        "admission": admission.stats(),
+        "snapshots": {
+            "builds": manager.snapshots.builds,
+            "hits": manager.snapshots.hits,
+            "coalesced": manager.snapshots.coalesced,
+        },
+        "shards": router.stats() if router is not None else None,
+    }
+
+
+@app.post("/admin/profile", response_class=PlainTextResponse)
+async def profile_server(
+    request: Request, seconds: float = 10.0, interval_ms: float = 5.0
+):
+    """
+    Samples every thread's stack for `seconds` (at most 60) and returns the
+    profile in folded format, e.g. for `flamegraph.pl` or speedscope.
+    """
+    check_admin(request)
+    if seconds <= 0:
+        raise HTTPException(status_code=400, detail="seconds must be positive")
+    try:
+        return await asyncio.to_thread(profiler.run, seconds, interval_ms / 1000)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/admin/traces")
+def get_slow_traces(request: Request, kind: Optional[str] = None, limit: int = 50):
+    check_admin(request)
+    return {**traces.stats(), "traces": traces.recent(kind, limit)}
+
+
 @app.get("/test")
 async def test_page():
     return FileResponse("static/test_client.html")
@@ -1,4 +1,13 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    DateTime,
+    ForeignKey,
+    JSON,
+    LargeBinary,
+    UniqueConstraint,
+)
 from sqlalchemy.sql import func
 from ..database.database import Base
 
@@ -23,6 +32,7 @@ class Event(Base):
     end_date = Column(DateTime(timezone=True))
     status = Column(String)  # active/ended
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    archived_at = Column(DateTime(timezone=True))  # set once rows move to the archive
 
 
 class EventParticipant(Base):
@@ -30,7 +40,7 @@ class EventParticipant(Base):
 
     id = Column(Integer, primary_key=True)
     user_id = Column(String, ForeignKey("users.id"))
-    event_id = Column(String, ForeignKey("events.id"))
+    event_id = Column(String, ForeignKey("events.id"), index=True)
     role = Column(String)
     joined_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -41,6 +51,53 @@ class Connection(Base):
     id = Column(Integer, primary_key=True)
     user_id_1 = Column(String, ForeignKey("users.id"))
     user_id_2 = Column(String, ForeignKey("users.id"))
-    event_id = Column(String, ForeignKey("events.id"))
+    event_id = Column(String, ForeignKey("events.id"), index=True)
     status = Column(String)  # pending/accepted
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class EventActivity(Base):
+    __tablename__ = "event_activity"
+    __table_args__ = (UniqueConstraint("event_id", "bucket_start"),)
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(String, ForeignKey("events.id"), nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)  # minute bucket
+    joins = Column(Integer, nullable=False, default=0)
+    active_sockets = Column(Integer, nullable=False, default=0)  # peak in the minute
+    connections_made = Column(Integer, nullable=False, default=0)
+    messages = Column(Integer, nullable=False, default=0)
+
+
+# Rows of ended events move here so the tables above only hold live events.
+# Ids are kept from the hot tables.
+class ArchivedEventParticipant(Base):
+    __tablename__ = "event_participants_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(String, ForeignKey("users.id"))
+    event_id = Column(String, ForeignKey("events.id"), index=True)
+    role = Column(String)
+    joined_at = Column(DateTime(timezone=True))
+
+
+class ArchivedConnection(Base):
+    __tablename__ = "connections_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id_1 = Column(String, ForeignKey("users.id"))
+    user_id_2 = Column(String, ForeignKey("users.id"))
+    event_id = Column(String, ForeignKey("events.id"), index=True)
+    status = Column(String)
+    created_at = Column(DateTime(timezone=True))
+
+
+class EventArchive(Base):
+    __tablename__ = "event_archives"
+
+    event_id = Column(String, ForeignKey("events.id"), primary_key=True)
+    format_version = Column(Integer, nullable=False)
+    participants = Column(Integer, nullable=False)
+    connections = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)  # gzipped compact graph JSON
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
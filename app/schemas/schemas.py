@@ -38,6 +38,7 @@ class EventCreate(EventBase):
 class Event(EventBase):
     id: str
     created_at: datetime
+    archived_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -80,3 +81,15 @@ class Connection(ConnectionBase):
 
     class Config:
         from_attributes = True
+
+
+# Event activity schemas
+class EventActivity(BaseModel):
+    bucket_start: datetime
+    joins: int
+    active_sockets: int
+    connections_made: int
+    messages: int
+
+    class Config:
+        from_attributes = True
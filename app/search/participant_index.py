@@ -0,0 +1,339 @@
+import asyncio
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from app.caching.versions import ResourceVersions, participants_key
+from app.websockets.snapshots import CachedSnapshot, SnapshotCache
+
+WORD = re.compile(r"[^\W_]+")
+NAME_WEIGHT = 1.0
+PROFILE_WEIGHT = 0.6
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+FUZZY_SCORE = 1.5
+MIN_FUZZY_LENGTH = 3
+MIN_SIMILARITY = 0.45
+# A one-letter prefix can match most of an event; only this many tokens
+# are expanded, shortest-first ranking still applies within them.
+MAX_PREFIX_TOKENS = 2000
+
+
+def normalize(text: str) -> str:
+    """
+    Casefolds and strips accents, so "José" is found by "jose".
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def words(text: str) -> List[str]:
+    return WORD.findall(normalize(text))
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"${token}$"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def profile_words(profile) -> Iterable[str]:
+    """
+    Yields the searchable words of a profile: its text values and lists of
+    text (e.g. skills). Links contribute only their last path segment, the
+    handle, rather than "https", "github", "com".
+    """
+    if not isinstance(profile, dict):
+        return
+    for value in profile.values():
+        values = value if isinstance(value, list) else [value]
+        for item in values:
+            if not isinstance(item, str):
+                continue
+            if "://" in item:
+                item = item.rstrip("/").rsplit("/", 1)[-1]
+            yield from words(item)
+
+
+class ParticipantIndex:
+    """
+    In-memory search index over one event's participants.
+
+    Tokens of each participant's name and profile are kept in a sorted list
+    for prefix lookups by bisection, and in a trigram index for fuzzy
+    matches. Name and profile postings are kept apart, so name matches
+    outrank profile matches and a query can walk the best postings first and
+    stop as soon as nothing left can beat the results it has.
+    """
+
+    def __init__(self, version: int = 0):
+        self.version = version
+        self.people: Dict[str, Tuple[str, Optional[str]]] = {}
+        self.name_postings: Dict[str, Dict[str, None]] = {}
+        self.profile_postings: Dict[str, Dict[str, None]] = {}
+        self.full_names: Dict[str, Dict[str, None]] = {}
+        self.tokens: List[str] = []
+        self.grams: Dict[str, Set[str]] = {}
+        self._gram_counts: Dict[str, int] = {}
+        self._person_tokens: Dict[str, Dict[str, float]] = {}
+
+    def __len__(self):
+        return len(self.people)
+
+    def add(self, user_id: str, name: Optional[str], role: Optional[str], profile=None):
+        """
+        Indexes a participant, replacing what was indexed for them before.
+        """
+        self.remove(user_id)
+        name = name or ""
+        self.people[user_id] = (name, role)
+        self.full_names.setdefault(" ".join(words(name)), {})[user_id] = None
+        weights: Dict[str, float] = {}
+        for token in profile_words(profile):
+            weights[token] = PROFILE_WEIGHT
+        for token in words(name):
+            weights[token] = NAME_WEIGHT
+        self._person_tokens[user_id] = weights
+        for token, weight in weights.items():
+            if token not in self._gram_counts:
+                insort(self.tokens, token)
+                grams = trigrams(token)
+                self._gram_counts[token] = len(grams)
+                for gram in grams:
+                    self.grams.setdefault(gram, set()).add(token)
+            postings = self.name_postings if weight == NAME_WEIGHT else self.profile_postings
+            postings.setdefault(token, {})[user_id] = None
+
+    def remove(self, user_id: str):
+        weights = self._person_tokens.pop(user_id, None)
+        if weights is None:
+            return
+        name, _ = self.people.pop(user_id)
+        full_name = " ".join(words(name))
+        del self.full_names[full_name][user_id]
+        if not self.full_names[full_name]:
+            del self.full_names[full_name]
+        for token, weight in weights.items():
+            postings = self.name_postings if weight == NAME_WEIGHT else self.profile_postings
+            del postings[token][user_id]
+            if not postings[token]:
+                del postings[token]
+            if token in self.name_postings or token in self.profile_postings:
+                continue
+            del self.tokens[bisect_left(self.tokens, token)]
+            del self._gram_counts[token]
+            for gram in trigrams(token):
+                tokens = self.grams[gram]
+                tokens.discard(token)
+                if not tokens:
+                    del self.grams[gram]
+
+    def _scored_tokens(self, term: str, fuzzy: bool) -> Dict[str, float]:
+        """
+        Scores the tokens matching one query term: exact, then prefix
+        (closer in length scores higher), then fuzzy by trigram similarity.
+        """
+        scored: Dict[str, float] = {}
+        start = bisect_left(self.tokens, term)
+        end = min(start + MAX_PREFIX_TOKENS, len(self.tokens))
+        for i in range(start, end):
+            token = self.tokens[i]
+            if not token.startswith(term):
+                break
+            if token == term:
+                scored[token] = EXACT_SCORE
+            else:
+                scored[token] = PREFIX_SCORE + 0.5 * len(term) / len(token)
+
+        if fuzzy and len(term) >= MIN_FUZZY_LENGTH:
+            query_grams = trigrams(term)
+            shared = Counter()
+            for gram in query_grams:
+                shared.update(self.grams.get(gram, ()))
+            for token, overlap in shared.items():
+                if token in scored:
+                    continue
+                similarity = 2 * overlap / (len(query_grams) + self._gram_counts[token])
+                if similarity >= MIN_SIMILARITY:
+                    scored[token] = FUZZY_SCORE * similarity
+        return scored
+
+    def _postings(self, scored: Dict[str, float]):
+        """
+        Yields (score, participants) for a term's matches, best first.
+        """
+        entries = []
+        for token, score in scored.items():
+            if token in self.name_postings:
+                entries.append((score * NAME_WEIGHT, self.name_postings[token]))
+            if token in self.profile_postings:
+                entries.append((score * PROFILE_WEIGHT, self.profile_postings[token]))
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        return entries
+
+    def _cost(self, scored: Dict[str, float]) -> int:
+        return sum(
+            len(self.name_postings.get(token, ())) + len(self.profile_postings.get(token, ()))
+            for token in scored
+        )
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        fuzzy: bool = True,
+        role: Optional[str] = None,
+    ) -> List[dict]:
+        """
+        Returns participants matching every word of `query` by prefix or,
+        when `fuzzy`, by trigram similarity, best first. A participant whose
+        whole name is the query gets an extra exact-match score.
+        """
+        terms = sorted(set(words(query)))
+        if not terms or limit <= 0:
+            return []
+        scored = [self._scored_tokens(term, fuzzy) for term in terms]
+        if not all(scored):
+            return []
+
+        # The term with the fewest postings drives the walk; the others only
+        # need checking for the participants it yields.
+        driver = min(scored, key=self._cost)
+        others = [term for term in scored if term is not driver]
+        rest_bound = sum(max(term.values()) for term in others) * NAME_WEIGHT
+
+        def score_of(user_id: str, base: float) -> Optional[float]:
+            total = base
+            tokens = self._person_tokens[user_id]
+            for term in others:
+                best = max(
+                    (term.get(token, 0.0) * weight for token, weight in tokens.items()),
+                    default=0.0,
+                )
+                if best == 0.0:
+                    return None
+                total += best
+            return total
+
+        heap: List[Tuple[float, int, str]] = []
+        seen: Set[str] = set()
+        order = 0
+
+        def offer(user_id: str, score: float):
+            nonlocal order
+            order -= 1
+            item = (score, order, user_id)
+            if len(heap) < limit:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+        for user_id in self.full_names.get(" ".join(words(query)), ()):
+            seen.add(user_id)
+            if role is not None and self.people[user_id][1] != role:
+                continue
+            base = max(driver.get(t, 0.0) * w for t, w in self._person_tokens[user_id].items())
+            score = score_of(user_id, base) if base else None
+            if score is not None:
+                offer(user_id, score + EXACT_SCORE)
+
+        for value, postings in self._postings(driver):
+            if len(heap) == limit and value + rest_bound <= heap[0][0]:
+                break
+            for user_id in postings:
+                if user_id in seen:
+                    continue
+                # Entries come best first, so this is the participant's best driver score
+                seen.add(user_id)
+                if role is not None and self.people[user_id][1] != role:
+                    continue
+                score = score_of(user_id, value)
+                if score is not None:
+                    offer(user_id, score)
+                if len(heap) == limit and value + rest_bound <= heap[0][0]:
+                    break
+
+        results = sorted(heap, reverse=True)
+        return [
+            {
+                "id": user_id,
+                "name": self.people[user_id][0],
+                "role": self.people[user_id][1],
+                "score": round(score, 3),
+            }
+            for score, _, user_id in results
+        ]
+
+
+class ParticipantSearch:
+    """
+    Keeps a ParticipantIndex for recently searched events.
+
+    Indexes are built from the shared event snapshot in a worker thread and
+    tagged with the event's participants version. `add` updates a current
+    index in place when someone joins; if the index has fallen behind (e.g.
+    a join on another shard), the next search rebuilds it. At most
+    `max_events` indexes are kept, least recently used first out.
+    """
+
+    def __init__(
+        self,
+        snapshots: SnapshotCache,
+        versions: ResourceVersions,
+        max_events: int = 64,
+    ):
+        self.snapshots = snapshots
+        self.versions = versions
+        self.max_events = max_events
+        self.builds = 0
+        self._indexes: "OrderedDict[str, ParticipantIndex]" = OrderedDict()
+
+    def _current(self, event_id: str) -> Optional[ParticipantIndex]:
+        index = self._indexes.get(event_id)
+        if index is not None and index.version == self.versions.version(
+            participants_key(event_id)
+        ):
+            self._indexes.move_to_end(event_id)
+            return index
+        return None
+
+    async def get(self, event_id: str) -> Optional[ParticipantIndex]:
+        index = self._current(event_id)
+        if index is not None:
+            return index
+        version = self.versions.version(participants_key(event_id))
+        cached = await self.snapshots.get(event_id)
+        if cached is None:
+            return None
+        index = await asyncio.to_thread(self._build, cached, version)
+        self.builds += 1
+        if version == self.versions.version(participants_key(event_id)):
+            self._indexes[event_id] = index
+            self._indexes.move_to_end(event_id)
+            while len(self._indexes) > self.max_events:
+                self._indexes.popitem(last=False)
+        return index
+
+    @staticmethod
+    def _build(cached: CachedSnapshot, version: int) -> ParticipantIndex:
+        index = ParticipantIndex(version)
+        for participant, profile in cached.decoded_profiles():
+            index.add(participant["id"], participant.get("name"), participant.get("role"), profile)
+        return index
+
+    def add(self, event_id: str, user: dict, role: Optional[str]):
+        """
+        Indexes a new participant, ahead of the participants version bump
+        that announces the join.
+        """
+        index = self._current(event_id)
+        if index is not None:
+            index.add(user["id"], user.get("name"), role, user.get("profile"))
+            index.version += 1
+
+    def forget(self, event_id: str):
+        self._indexes.pop(event_id, None)
+
+    def event_ids(self) -> List[str]:
+        return list(self._indexes)
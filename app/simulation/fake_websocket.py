@@ -0,0 +1,140 @@
+import asyncio
+import json
+import random
+import time
+from typing import List, Optional, Tuple
+from fastapi import WebSocketDisconnect
+
+
+class ConnectionLost(Exception):
+    pass
+
+
+class NetworkProfile:
+    """
+    How a simulated client's link behaves: one-way latency with jitter,
+    downstream bandwidth, how many bytes the server may buffer before a send
+    blocks, and the chance that any send fails as if the link dropped.
+    """
+
+    __slots__ = ("latency", "jitter", "bandwidth", "buffer_bytes", "fail_rate")
+
+    def __init__(
+        self,
+        latency: float = 0.02,
+        jitter: float = 0.005,
+        bandwidth: float = 1_000_000.0,
+        buffer_bytes: int = 64 * 1024,
+        fail_rate: float = 0.0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.buffer_bytes = buffer_bytes
+        self.fail_rate = fail_rate
+
+    def delay(self, rng: random.Random) -> float:
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+
+class FakeWebSocket:
+    """
+    Stands in for a Starlette WebSocket in websocket_endpoint and
+    ConnectionManager, with the client's side of the conversation built in.
+
+    Server sends occupy the link for size / bandwidth and reach the client
+    after the link latency. Like a real transport, a send only waits when
+    more than `buffer_bytes` are still queued on the link, so a slow client
+    holds up whoever is sending to it once its buffer fills. Delivered
+    messages are kept with their arrival time; pings are answered with a
+    pong automatically.
+    """
+
+    def __init__(self, profile: NetworkProfile, rng: Optional[random.Random] = None):
+        self.profile = profile
+        self.rng = rng or random.Random()
+        self.accepted = False
+        self.closed = False
+        self.close_code: Optional[int] = None
+        self.opened_at = time.perf_counter()
+        self.delivered: List[Tuple[float, str]] = []
+        self.bytes_delivered = 0
+        self._link_free_at = 0.0
+        self._incoming: asyncio.Queue = asyncio.Queue()
+        self._first_delivery = asyncio.get_running_loop().create_future()
+
+    # Server side, as used by the app
+
+    async def accept(self, *args, **kwargs):
+        # The handshake response reaches the client one link delay later
+        await asyncio.sleep(self.profile.delay(self.rng))
+        self.accepted = True
+
+    async def send_text(self, text: str):
+        if self.closed:
+            raise ConnectionLost("Send on a closed socket")
+        if self.profile.fail_rate and self.rng.random() < self.profile.fail_rate:
+            self.drop(1006)
+            raise ConnectionLost("Injected send failure")
+
+        now = time.perf_counter()
+        start = max(now, self._link_free_at)
+        self._link_free_at = start + len(text) / self.profile.bandwidth
+        arrival = self._link_free_at + self.profile.delay(self.rng)
+        loop = asyncio.get_running_loop()
+        loop.call_later(arrival - now, self._deliver, arrival, text)
+
+        # Backpressure: wait while more than buffer_bytes are still queued
+        queued_for = self._link_free_at - now - self.profile.buffer_bytes / self.profile.bandwidth
+        if queued_for > 0:
+            await asyncio.sleep(queued_for)
+
+    async def send_json(self, data):
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+    async def receive_json(self):
+        message = await self._incoming.get()
+        if isinstance(message, WebSocketDisconnect):
+            raise message
+        return message
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None):
+        self.drop(code)
+
+    # Client side, as driven by the harness
+
+    def _deliver(self, arrival: float, text: str):
+        if self.closed:
+            return
+        self.delivered.append((arrival, text))
+        self.bytes_delivered += len(text)
+        if not self._first_delivery.done():
+            self._first_delivery.set_result(arrival)
+        if '"type":"ping"' in text:
+            self.client_send({"type": "pong"})
+
+    def client_send(self, message: dict):
+        if self.closed:
+            return
+        loop = asyncio.get_running_loop()
+        loop.call_later(self.profile.delay(self.rng), self._incoming.put_nowait, message)
+
+    def drop(self, code: int = 1000):
+        """
+        Closes the connection from either side; the server's next receive
+        raises WebSocketDisconnect.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.close_code = code
+        self._incoming.put_nowait(WebSocketDisconnect(code))
+        if not self._first_delivery.done():
+            self._first_delivery.set_result(None)
+
+    async def first_message(self) -> Optional[float]:
+        """
+        Waits for the first delivered message (the initial state) and
+        returns its arrival time, or None if the socket closed first.
+        """
+        return await self._first_delivery
@@ -0,0 +1,223 @@
+import asyncio
+import os
+import random
+import re
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+from app.bench_live_state import make_profile
+from app.simulation.fake_websocket import FakeWebSocket, NetworkProfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# A named in-memory SQLite database, shared by every thread's connection
+SIM_DATABASE_URL = "sqlite:///file:nodiverse_sim?mode=memory&cache=shared&uri=true"
+SEQ = re.compile(r'"sim_seq":(\d+)')
+
+
+def configure(server_layout: bool = True):
+    """
+    Points the app at the in-memory database and a scratch message log, and
+    turns on tracing of every operation. app.main reads its configuration
+    at import, so this has to run before anything imports it.
+    """
+    os.environ["DATABASE_URL"] = SIM_DATABASE_URL
+    os.environ["MESSAGE_LOG_DIR"] = tempfile.mkdtemp(prefix="nodiverse-sim-")
+    os.environ["TRACE_THRESHOLD_MS"] = "0.000001"
+    os.environ["TRACE_KEEP"] = "1000000"
+    os.environ["SERVER_LAYOUT"] = "1" if server_layout else "0"
+    os.environ.pop("SHARD_PEERS", None)
+
+
+def load_app():
+    """
+    Imports app.main (from the app directory, where it expects `static`)
+    and creates the schema in the in-memory database.
+    """
+    cwd = os.getcwd()
+    os.chdir(APP_DIR)
+    try:
+        from app import main
+    finally:
+        os.chdir(cwd)
+    from app.database.database import Base, engine
+
+    Base.metadata.create_all(engine)
+    return main
+
+
+def percentiles(values: List[float]) -> dict:
+    """
+    Summarizes durations in seconds as milliseconds.
+    """
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def at(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": at(0.50),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+class SimClient:
+    __slots__ = ("user_id", "event_id", "websocket", "task", "started")
+
+    def __init__(self, user_id: str, event_id: str, websocket: FakeWebSocket, task, started: float):
+        self.user_id = user_id
+        self.event_id = event_id
+        self.websocket = websocket
+        self.task = task
+        self.started = started
+
+
+class Harness:
+    """
+    Drives app.main's websocket_endpoint and ConnectionManager in-process
+    with FakeWebSockets, against the in-memory database.
+
+    The seed fixes what a run does: which users are picked, each link's
+    jitter and which sends fail. How long it takes is not reproducible.
+    Everything runs on the real clock, with DB lookups and layout in real
+    threads, so latencies and where backpressure kicks in vary with host
+    load. Compare timings across runs on the same machine only, and gate
+    CI on counts (lost messages, failed connects), never on latency.
+    """
+
+    def __init__(self, main, seed: int = 0):
+        self.main = main
+        self.rng = random.Random(seed)
+        self.published: Dict[int, float] = {}
+        self._seq = 0
+
+    def seed_event(self, users: int) -> Tuple[str, List[str]]:
+        """
+        Inserts an event with `users` participants and returns their ids.
+        """
+        from app.database.database import SessionLocal
+        from app.models import models
+
+        event_id = str(uuid.uuid4())
+        user_ids = [str(uuid.uuid4()) for _ in range(users)]
+        roles = ["participant", "mentor", "organizer"]
+        db = SessionLocal()
+        try:
+            db.add(models.Event(id=event_id, name="Simulated event", status="active"))
+            db.bulk_insert_mappings(
+                models.User,
+                [
+                    {
+                        "id": user_id,
+                        "name": f"Attendee {i}",
+                        "email": f"{user_id}@sim.invalid",
+                        "role": roles[i % 3],
+                        "profile": make_profile(i),
+                    }
+                    for i, user_id in enumerate(user_ids)
+                ],
+            )
+            db.bulk_insert_mappings(
+                models.EventParticipant,
+                [
+                    {"user_id": user_id, "event_id": event_id, "role": roles[i % 3]}
+                    for i, user_id in enumerate(user_ids)
+                ],
+            )
+            db.commit()
+        finally:
+            db.close()
+        return event_id, user_ids
+
+    def connect(self, event_id: str, user_id: str, profile: NetworkProfile) -> SimClient:
+        websocket = FakeWebSocket(profile, random.Random(self.rng.random()))
+        started = time.perf_counter()
+        task = asyncio.create_task(self.main.websocket_endpoint(websocket, event_id, user_id))
+        return SimClient(user_id, event_id, websocket, task, started)
+
+    async def connect_many(
+        self, event_id: str, user_ids: List[str], profiles: List[NetworkProfile]
+    ) -> Tuple[List[SimClient], List[float]]:
+        """
+        Connects every user at once and waits for each initial state.
+        Returns the clients and the connect latencies of those that got one.
+        """
+        clients = [
+            self.connect(event_id, user_id, profile)
+            for user_id, profile in zip(user_ids, profiles)
+        ]
+        arrivals = await asyncio.gather(*(c.websocket.first_message() for c in clients))
+        latencies = [
+            arrival - client.started
+            for client, arrival in zip(clients, arrivals)
+            if arrival is not None
+        ]
+        return clients, latencies
+
+    async def publish(self, event_id: str, message: dict) -> int:
+        """
+        Publishes a message the way a REST write does, tagged with a
+        sequence number so deliveries can be matched to it.
+        """
+        from app.caching.versions import graph_key
+
+        self._seq += 1
+        message.setdefault("data", {})["sim_seq"] = self._seq
+        self.published[self._seq] = time.perf_counter()
+        await self.main.publish(bump=(graph_key(event_id),), event_id=event_id, message=message)
+        return self._seq
+
+    def delivery_latencies(self, clients: List[SimClient]) -> List[float]:
+        latencies = []
+        for client in clients:
+            for arrival, text in client.websocket.delivered:
+                match = SEQ.search(text)
+                if match is not None:
+                    latencies.append(arrival - self.published[int(match.group(1))])
+        return latencies
+
+    async def drop(self, clients: List[SimClient], code: int = 1000):
+        for client in clients:
+            client.websocket.drop(code)
+        await asyncio.gather(*(client.task for client in clients), return_exceptions=True)
+
+    def trace_summary(self) -> dict:
+        """
+        Per-kind duration percentiles and mean stage times of everything
+        traced since the last clear.
+        """
+        summary = {}
+        for kind in ("connect", "broadcast"):
+            traces = self.main.traces.recent(kind, limit=10**9)
+            if not traces:
+                continue
+            stages: Dict[str, float] = {}
+            for trace in traces:
+                for stage, ms in trace["stages_ms"].items():
+                    stages[stage] = stages.get(stage, 0.0) + ms
+            summary[kind] = {
+                **percentiles([t["duration_ms"] / 1000 for t in traces]),
+                "mean_stage_ms": {
+                    stage: round(total / len(traces), 3) for stage, total in stages.items()
+                },
+            }
+        return summary
+
+    def reset(self):
+        self.main.traces.clear()
+        self.published.clear()
+
+    def counters(self) -> dict:
+        snapshots = self.main.manager.snapshots
+        return {
+            "snapshot_builds": snapshots.builds,
+            "snapshot_hits": snapshots.hits,
+            "snapshot_coalesced": snapshots.coalesced,
+            "admission": self.main.admission.stats(),
+        }
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import shutil
+import time
+from typing import Callable, Dict, List
+
+from app.simulation.fake_websocket import NetworkProfile
+from app.simulation.harness import Harness, configure, load_app, percentiles
+
+
+def _drain_time(profile: NetworkProfile) -> float:
+    # Long enough for anything still on the wire to arrive
+    return profile.latency + profile.jitter + profile.buffer_bytes / profile.bandwidth + 0.05
+
+
+async def connect_storm(h: Harness, args, profile: NetworkProfile) -> dict:
+    event_id, user_ids = h.seed_event(args.users)
+    h.reset()
+    before = h.counters()
+    started = time.perf_counter()
+    clients, latencies = await h.connect_many(event_id, user_ids, [profile] * len(user_ids))
+    elapsed = time.perf_counter() - started
+    report = {
+        "connected": len(latencies),
+        "failed_connects": len(clients) - len(latencies),
+        "wall_s": round(elapsed, 3),
+        "connects_per_s": round(len(latencies) / elapsed, 1),
+        "connect_latency": percentiles(latencies),
+        "counters_before": before,
+        "counters_after": h.counters(),
+        "traces": h.trace_summary(),
+    }
+    await h.drop(clients)
+    return report
+
+
+async def _broadcast_run(
+    h: Harness, args, profiles: List[NetworkProfile], groups: Dict[str, Callable[[int], bool]]
+) -> dict:
+    event_id, user_ids = h.seed_event(args.users)
+    clients, _ = await h.connect_many(event_id, user_ids, profiles)
+    connected = [c for c in clients if not c.websocket.closed]
+    h.reset()
+
+    started = time.perf_counter()
+    for _ in range(args.messages):
+        source, target = h.rng.sample(user_ids, 2)
+        await h.publish(
+            event_id,
+            {
+                "type": "new_connection",
+                "data": {"source": source, "target": target, "status": "accepted"},
+            },
+        )
+        if args.interval:
+            await asyncio.sleep(args.interval)
+    publish_elapsed = time.perf_counter() - started
+    await asyncio.sleep(max(_drain_time(p) for p in profiles))
+
+    expected = args.messages * len(connected)
+    latencies = h.delivery_latencies(connected)
+    # Clients still open at the end must have everything, failures or not
+    still_open = [c for c in connected if not c.websocket.closed]
+    delivered_open = len(h.delivery_latencies(still_open))
+    last_arrival = max(
+        (arrival for c in connected for arrival, _ in c.websocket.delivered), default=started
+    )
+    report = {
+        "recipients": len(connected),
+        "failed_connects": len(clients) - len(connected),
+        "messages": args.messages,
+        "delivered": len(latencies),
+        "expected": expected,
+        "lost": expected - len(latencies),
+        "lost_by_open_clients": args.messages * len(still_open) - delivered_open,
+        "publish_wall_s": round(publish_elapsed, 3),
+        "broadcasts_per_s": round(args.messages / publish_elapsed, 1),
+        "deliveries_per_s": round(len(latencies) / max(last_arrival - started, 1e-9), 1),
+        "delivery_latency": percentiles(latencies),
+        "traces": h.trace_summary(),
+    }
+    for name, member in groups.items():
+        report[f"delivery_latency_{name}"] = percentiles(
+            h.delivery_latencies([c for i, c in enumerate(clients) if member(i) and c in connected])
+        )
+    await h.drop(clients)
+    return report
+
+
+async def broadcast(h: Harness, args, profile: NetworkProfile) -> dict:
+    return await _broadcast_run(h, args, [profile] * args.users, {})
+
+
+async def slow_consumers(h: Harness, args, profile: NetworkProfile) -> dict:
+    slow = NetworkProfile(
+        latency=profile.latency * 5,
+        jitter=profile.jitter,
+        bandwidth=args.slow_bandwidth_kbps * 1000 / 8,
+        buffer_bytes=16 * 1024,
+        fail_rate=profile.fail_rate,
+    )
+    every = max(1, round(1 / args.slow_fraction)) if args.slow_fraction > 0 else 0
+
+    def is_slow(i: int) -> bool:
+        return bool(every) and i % every == 0
+
+    profiles = [slow if is_slow(i) else profile for i in range(args.users)]
+    return await _broadcast_run(
+        h, args, profiles, {"fast": lambda i: not is_slow(i), "slow": is_slow}
+    )
+
+
+async def reconnect_waves(h: Harness, args, profile: NetworkProfile) -> dict:
+    event_id, user_ids = h.seed_event(args.users)
+    clients, latencies = await h.connect_many(event_id, user_ids, [profile] * len(user_ids))
+    failed = len(clients) - len(latencies)
+    h.reset()
+    waves = []
+    for _ in range(args.waves):
+        leaving = h.rng.sample(clients, int(len(clients) * args.wave_fraction))
+        started = time.perf_counter()
+        await h.drop(leaving, code=1006)
+        dropped = time.perf_counter() - started
+        returning, latencies = await h.connect_many(
+            event_id, [c.user_id for c in leaving], [profile] * len(leaving)
+        )
+        failed += len(returning) - len(latencies)
+        waves.append(
+            {
+                "clients": len(leaving),
+                "disconnect_wall_s": round(dropped, 3),
+                "reconnected": len(latencies),
+                "reconnect_latency": percentiles(latencies),
+            }
+        )
+        kept = {id(c) for c in leaving}
+        clients = [c for c in clients if id(c) not in kept] + returning
+    report = {
+        "waves": waves,
+        "failed_connects": failed,
+        "sockets_after": h.main.manager.state.event_size(event_id),
+        "counters": h.counters(),
+        "traces": h.trace_summary(),
+    }
+    await h.drop(clients)
+    return report
+
+
+def forged_layout_nodes(h: Harness, event_id: str, real: set) -> int:
+    layout = h.main.manager.layouts.get(event_id)
+    if layout is None or layout.layout is None:
+        return 0
+    return len(set(layout.layout.ids) - real)
+
+
+async def forged_writes(h: Harness, args, profile: NetworkProfile) -> dict:
+    event_id, user_ids = h.seed_event(args.users)
+    clients, _ = await h.connect_many(event_id, user_ids, [profile] * len(user_ids))
+    connected = [c for c in clients if not c.websocket.closed]
+    h.reset()
+
+    # Graph messages are the server's to send; clients relaying them must
+    # not reach the routing index or the layout
+    for i in range(args.messages):
+        forger = h.rng.choice(connected)
+        fake_id = f"forged-{i}"
+        forger.websocket.client_send(
+            {"type": "new_user", "data": None, "user": {"id": fake_id, "role": "organizer"}}
+        )
+        forger.websocket.client_send(
+            {"type": "new_connection", "data": {"source": fake_id, "target": forger.user_id}}
+        )
+    await asyncio.sleep(_drain_time(profile) * 2)
+
+    routing = h.main.manager.routing[event_id]
+    real = set(user_ids)
+    report = {
+        "forgers": args.messages,
+        "failed_connects": len(clients) - len(connected),
+        "forged_routing_nodes": len((set(routing.adjacency) | set(routing.roles)) - real),
+        "forged_layout_nodes": forged_layout_nodes(h, event_id, real),
+        "traces": h.trace_summary(),
+    }
+    await h.drop(clients)
+    return report
+
+
+SCENARIOS = {
+    "connect_storm": connect_storm,
+    "broadcast": broadcast,
+    "slow_consumers": slow_consumers,
+    "reconnect_waves": reconnect_waves,
+    "forged_writes": forged_writes,
+}
+
+
+def print_report(name: str, report: dict, indent: int = 0):
+    pad = "  " * indent
+    if indent == 0:
+        print(f"\n== {name} ==")
+    for key, value in report.items():
+        if isinstance(value, dict):
+            print(f"{pad}{key}:")
+            print_report(key, value, indent + 1)
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                print(f"{pad}{key}[{i}]:")
+                print_report(key, item, indent + 1)
+        else:
+            print(f"{pad}{key}: {value}")
+
+
+async def run(args) -> Dict[str, dict]:
+    main = load_app()
+    h = Harness(main, seed=args.seed)
+    profile = NetworkProfile(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        bandwidth=args.bandwidth_kbps * 1000 / 8,
+        fail_rate=args.fail_rate,
+    )
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    reports = {}
+    for name in names:
+        before = main.admission.stats()
+        # The app's debug prints would swamp the report and the timings
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            reports[name] = await SCENARIOS[name](h, args, profile)
+            await main.message_log.close()
+        after = main.admission.stats()
+        for key in ("rejected", "timed_out"):
+            reports[name][f"admission_{key}"] = after[key] - before[key]
+    return reports
+
+
+def check(reports: Dict[str, dict], args) -> List[str]:
+    """
+    Returns what went wrong in a run, for use as a CI gate. Injected send
+    failures excuse lost deliveries and failed connects, but not losses to
+    clients still open at the end, and never admission rejections.
+    """
+    problems = []
+
+    def total(key: str) -> int:
+        return sum(report.get(key, 0) for report in reports.values())
+
+    lost_open = total("lost_by_open_clients")
+    if lost_open:
+        problems.append(f"{lost_open} deliveries to open clients were lost")
+    if not args.fail_rate:
+        lost = total("lost")
+        if lost:
+            problems.append(f"{lost} deliveries were lost")
+        failed = total("failed_connects")
+        if failed:
+            problems.append(f"{failed} connects failed")
+    forged = total("forged_routing_nodes")
+    if forged:
+        problems.append(f"{forged} client-forged nodes reached the routing index")
+    forged = total("forged_layout_nodes")
+    if forged:
+        problems.append(f"{forged} client-forged nodes reached the server layout")
+    rejected = total("admission_rejected") + total("admission_timed_out")
+    if rejected:
+        problems.append(f"{rejected} connects were rejected or timed out in admission")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay realtime load scenarios in-process against fake websockets."
+    )
+    parser.add_argument("scenario", choices=["all", *SCENARIOS], nargs="?", default="all")
+    parser.add_argument("-u", "--users", type=int, default=1000)
+    parser.add_argument("-m", "--messages", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.0, help="Seconds between broadcasts")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--bandwidth-kbps", type=float, default=8000.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Chance that any send fails")
+    parser.add_argument("--slow-fraction", type=float, default=0.05)
+    parser.add_argument("--slow-bandwidth-kbps", type=float, default=128.0)
+    parser.add_argument("--waves", type=int, default=3)
+    parser.add_argument("--wave-fraction", type=float, default=0.3)
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Fixes users, jitter and failures, not timings"
+    )
+    parser.add_argument("--no-layout", action="store_true", help="Disable server-side layout")
+    parser.add_argument("--json", action="store_true", help="Print the reports as JSON")
+    args = parser.parse_args(argv)
+
+    configure(server_layout=not args.no_layout)
+    try:
+        reports = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(os.environ["MESSAGE_LOG_DIR"], ignore_errors=True)
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for name, report in reports.items():
+            print_report(name, report)
+
+    problems = check(reports, args)
+    if problems:
+        print("\n" + "\n".join(problems))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class AdmissionControl:
+    """
+    Bounds how many websocket handshakes run at once. Extra handshakes wait
+    in a bounded queue for up to `timeout` seconds and are rejected beyond
+    that, so a connect storm queues up instead of exhausting the DB pool.
+    """
+
+    def __init__(self, max_concurrent: int = 64, max_queue: int = 1024, timeout: float = 10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    @asynccontextmanager
+    async def admit(self):
+        if not self._semaphore.locked():
+            # A free slot is taken without suspending
+            await self._semaphore.acquire()
+        elif self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected("Handshake queue is full")
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise AdmissionRejected("Timed out waiting for a handshake slot")
+            finally:
+                self.waiting -= 1
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
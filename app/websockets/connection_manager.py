@@ -1,102 +1,304 @@
+import asyncio
+import contextlib
+import json
 from fastapi import WebSocket
-from typing import Dict, Set
-from app.database.database import SessionLocal
-from app.models import models
+from typing import Callable, Dict, Optional, Tuple, Union
+from app.analytics.rollups import ActivityRollups
+from app.diagnostics.tracing import SlowTraces, stage
+from app.layout.event_layout import EventLayout
+from app.websockets.admission import AdmissionControl
+from app.websockets.live_state import LiveState
+from app.websockets.message_log import MessageLog
+from app.websockets.snapshots import (
+    SnapshotCache,
+    copy_for_client,
+    encode_snapshot,
+    user_exists,
+)
+from app.websockets.subscriptions import EventRoutingIndex, Subscription
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.event_participants: Dict[str, Set[str]] = {}
+    def __init__(
+        self,
+        message_log: Optional[MessageLog] = None,
+        rollups: Optional[ActivityRollups] = None,
+        server_layout: bool = False,
+        snapshots: Optional[SnapshotCache] = None,
+        traces: Optional[SlowTraces] = None,
+        admission: Optional[AdmissionControl] = None,
+    ):
+        self.state = LiveState()
+        self.snapshots = snapshots or SnapshotCache()
+        self.routing: Dict[str, EventRoutingIndex] = {}
+        self.layouts: Dict[str, EventLayout] = {}
+        # event_id -> (snapshot, layout revision, encoded initial_state)
+        self._initial_states: Dict[str, Tuple[object, Optional[int], str]] = {}
+        # event_id -> (graph version, layout) for events with no sockets
+        self._offline_layouts: Dict[str, Tuple[int, EventLayout]] = {}
+        self.server_layout = server_layout
+        self.message_log = message_log
+        self.rollups = rollups
+        self.traces = traces or SlowTraces(threshold_ms=0)
+        self.admission = admission
+        self.reaped = 0
         print("Connection Manager initialized")  # Debug line
 
     async def connect(self, websocket: WebSocket, user_id: str, event_id: str):
-        db = SessionLocal()  # Initialize database session
+        with self.traces.trace("connect", event_id):
+            return await self._connect(websocket, user_id, event_id)
 
+    async def _connect(self, websocket: WebSocket, user_id: str, event_id: str):
         try:
-            user = db.query(models.User).filter(models.User.id == user_id).first()
-            event = db.query(models.Event).filter(models.Event.id == event_id).first()
+            # The admission slot covers the DB work and registration; sending
+            # the initial state to a slow client must not hold up the queue.
+            admit = self.admission.admit() if self.admission else contextlib.nullcontext()
+            async with admit:
+                with stage("db"):
+                    cached = await self.snapshots.get(event_id)
+                    # Participants are known to exist; anyone else needs a lookup
+                    user_found = cached is not None and (
+                        user_id in cached.participant_ids
+                        or await asyncio.to_thread(user_exists, user_id)
+                    )
 
-            if not user or not event:
-                print(
-                    f"User or event not found: user={user is not None}, event={event is not None}"
-                )
-                return False
+                if cached is None or not user_found:
+                    print(
+                        f"User or event not found: user={user_found}, event={cached is not None}"
+                    )
+                    return False
+                if cached.data["event"].get("archived"):
+                    print(f"Event {event_id} has ended")  # Debug line
+                    return False
 
-            await websocket.accept()
-            self.active_connections[user_id] = websocket
+                with stage("handshake"):
+                    await websocket.accept()
+                if self.server_layout:
+                    with stage("layout"):
+                        await self._ensure_layout(event_id, cached.data)
 
-            if event_id not in self.event_participants:
-                self.event_participants[event_id] = set()
-            self.event_participants[event_id].add(user_id)
+                # The graph may have changed while waiting; retry so the socket is
+                # registered in the same step as the snapshot it is sent.
+                for _ in range(3):
+                    if self.snapshots.is_current(event_id, cached):
+                        break
+                    with stage("db"):
+                        cached = await self.snapshots.get(event_id) or cached
 
-            participants = (
-                db.query(models.EventParticipant, models.User)
-                .join(models.User, models.EventParticipant.user_id == models.User.id)
-                .filter(models.EventParticipant.event_id == event_id)
-                .all()
-            )
+                previous_event = self.state.event_of(user_id)
+                if previous_event is not None:
+                    # A reconnect replaces the user's old socket
+                    self.state.remove(user_id, previous_event)
+                    self._release(user_id, previous_event)
+                self.state.add(user_id, event_id, websocket)
+                if self.rollups is not None:
+                    self.rollups.socket_opened(event_id)
 
-            participant_list = [
-                {
-                    "id": participant.User.id,
-                    "name": participant.User.name,  # ✅ Get the correct name
-                    "role": participant.EventParticipant.role,
-                    "profile": participant.User.profile,  # ✅ Get the correct profile
-                }
-                for participant in participants
-            ]
-
-            await websocket.send_json(
-                {
-                    "type": "initial_state",
-                    "data": {
-                        "event": {"id": event.id, "name": event.name, "type": "event"},
-                        "participants": participant_list,  # ✅ Send correct data here
-                        "connections": [
-                            {
-                                "source": conn.user_id_1,
-                                "target": conn.user_id_2,
-                                "status": conn.status,
-                            }
-                            for conn in db.query(models.Connection)
-                            .filter(models.Connection.event_id == event_id)
-                            .all()
-                        ],
-                    },
-                }
-            )
+                if event_id not in self.routing:
+                    self.routing[event_id] = EventRoutingIndex(self.state.users.canonical)
+                    self.routing[event_id].load_snapshot(cached.data)
+                self.routing[event_id].subscribe(user_id)
+
+            with stage("serialization"):
+                text = self._initial_state(event_id, cached)
+
+            with stage("send"):
+                await websocket.send_text(text)
 
             return True
         except Exception as e:
             print(f"Error in connect: {str(e)}")
             raise
-        finally:
-            db.close()
 
-    async def disconnect(self, user_id: str, event_id: str):
+    def _initial_state(self, event_id: str, cached) -> str:
+        """
+        Encodes the initial_state message once per snapshot and layout
+        revision; every socket in the event is sent the same text.
+        """
+        layout = self.layouts.get(event_id)
+        revision = layout.revision if layout is not None and layout.ready else None
+        encoded = self._initial_states.get(event_id)
+        if encoded is not None and encoded[0] is cached and encoded[1] == revision:
+            return encoded[2]
+        snapshot = copy_for_client(cached.data)
+        self.annotate_snapshot(event_id, snapshot)
+        text = (
+            '{"type":"initial_state","data":' + encode_snapshot(snapshot, cached.profiles) + "}"
+        )
+        self._initial_states[event_id] = (cached, revision, text)
+        return text
+
+    async def disconnect(
+        self, user_id: str, event_id: str, websocket: Optional[WebSocket] = None
+    ):
         try:
-            if user_id in self.active_connections:
-                del self.active_connections[user_id]
+            current = self.state.socket(user_id, event_id)
+            # Ignore a stale socket whose user has already reconnected
+            if current is None or (websocket is not None and current is not websocket):
+                return
 
-            if event_id in self.event_participants:
-                self.event_participants[event_id].remove(user_id)
-                print(f"User {user_id} removed from {event_id}")  # Debug line
+            self.state.remove(user_id, event_id)
+            self._release(user_id, event_id)
+            print(f"User {user_id} removed from {event_id}")  # Debug line
 
-                # Notify others about disconnect
-                await self.broadcast_to_event(
-                    event_id, {"type": "node_left", "data": {"user_id": user_id}}
-                )
+            # Notify others about disconnect
+            await self.broadcast_to_event(
+                event_id, {"type": "node_left", "data": {"user_id": user_id}}, graph_write=True
+            )
         except Exception as e:
             print(f"Error in disconnect: {str(e)}")  # Debug line
 
-    async def broadcast_to_event(self, event_id: str, message: dict):
+    def _release(self, user_id: str, event_id: str):
+        """
+        Drops a departed socket from the event's routing and counters, and
+        the event's live state once nobody is left.
+        """
+        if event_id in self.routing:
+            self.routing[event_id].unsubscribe(user_id)
+        if not self.state.has_event(event_id):
+            self.routing.pop(event_id, None)
+            self.layouts.pop(event_id, None)
+            self._initial_states.pop(event_id, None)
+            self.snapshots.forget(event_id)
+        if self.rollups is not None:
+            self.rollups.socket_closed(event_id)
+
+    async def _ensure_layout(self, event_id: str, snapshot: dict):
+        """
+        Builds the event's layout on first connect. Concurrent connects wait
+        for the same build instead of starting their own.
+        """
+        layout = self.layouts.get(event_id)
+        if layout is None:
+            self._offline_layouts.pop(event_id, None)
+            layout = self.layouts[event_id] = EventLayout(snapshot)
+            await layout.build()
+        else:
+            await layout.wait_ready()
+
+    def annotate_snapshot(self, event_id: str, snapshot: dict):
+        layout = self.layouts.get(event_id)
+        if layout is not None and layout.ready:
+            layout.annotate_snapshot(snapshot)
+
+    async def layout_snapshot(self, event_id: str, snapshot: dict, version: int):
+        """
+        Stamps a client copy of the snapshot, at graph `version`, with
+        coordinates. Events with no sockets have no live layout, so one is
+        built and kept until the graph changes; layouts are seeded, so it
+        matches what a connect would build.
+        """
+        if not self.server_layout:
+            return
+        layout = self.layouts.get(event_id)
+        if layout is None:
+            offline = self._offline_layouts.get(event_id)
+            if offline is not None and offline[0] == version:
+                layout = offline[1]
+                await layout.wait_ready()
+            else:
+                layout = EventLayout(snapshot)
+                self._offline_layouts[event_id] = (version, layout)
+                await layout.build()
+        else:
+            await layout.wait_ready()
+        layout.annotate_snapshot(snapshot)
+
+    def subscribe(self, event_id: str, user_id: str, data: dict) -> dict:
+        """
+        Narrows which broadcasts a socket receives. Raises ValueError for an
+        invalid subscription.
+        """
+        routing = self.routing.get(event_id)
+        if routing is None or self.state.socket(user_id, event_id) is None:
+            raise ValueError("Not connected to this event")
+        subscription = Subscription.from_dict(data, user_id)
+        routing.subscribe(user_id, subscription)
+        return subscription.as_dict()
+
+    async def broadcast_to_event(self, event_id: str, message: dict, graph_write: bool = False):
+        """
+        Sends a message to the event's subscribers. `graph_write` marks
+        messages the server made from its own writes; only those update the
+        layout and routing index, so clients cannot relay made-up nodes and
+        edges into them.
+        """
+        with self.traces.trace("broadcast", f"{event_id} {message.get('type')}"):
+            await self._broadcast(event_id, message, graph_write)
+
+    async def _broadcast(self, event_id: str, message: dict, graph_write: bool = False):
         try:
-            if event_id in self.event_participants:
-                print(f"Broadcasting to event {event_id}: {message}")  # Debug line
-                for user_id in self.event_participants[event_id]:
-                    if user_id in self.active_connections:
-                        await self.active_connections[user_id].send_json(message)
-                        print(f"Message sent to user {user_id}")  # Debug line
+            if graph_write and event_id in self.layouts:
+                with stage("layout"):
+                    self.layouts[event_id].apply(message)
+            if self.message_log is not None:
+                self.message_log.append(event_id, message)
+            if self.rollups is not None:
+                self.rollups.record_message(event_id)
+
+            if self.state.has_event(event_id):
+                routing = self.routing.get(event_id)
+                with stage("routing"):
+                    if routing is not None:
+                        if graph_write:
+                            routing.apply(message)
+                        recipients = routing.recipients(message)
+                    else:
+                        recipients = self.state.member_ids(event_id)
+                # Encoded once for every recipient, as send_json would
+                with stage("serialization"):
+                    text = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+                failed = []
+                with stage("send"):
+                    for user_id in recipients:
+                        websocket = self.state.socket(user_id, event_id)
+                        if websocket is None:
+                            continue
+                        try:
+                            await websocket.send_text(text)
+                        except Exception as e:
+                            # One dead socket must not cost everyone after it the message
+                            print(f"Error sending to user {user_id}: {str(e)}")
+                            failed.append((user_id, websocket))
+                for user_id, websocket in failed:
+                    await self.reap(user_id, event_id, websocket)
         except Exception as e:
             print(f"Error in broadcast: {str(e)}")  # Debug line
+
+    async def reap(self, user_id: str, event_id: str, websocket: WebSocket, code: int = 1011):
+        """
+        Removes a socket that could not be written to, unless its user has
+        already replaced it, and closes it with `code`.
+        """
+        if self.state.socket(user_id, event_id) is not websocket:
+            return
+        self.reaped += 1
+        print(f"Reaping dead socket for {user_id} in {event_id}")  # Debug line
+        await self.disconnect(user_id, event_id, websocket)
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def evict_event(
+        self, event_id: str, code: int = 1001, reason: Union[str, Callable[[str], str]] = ""
+    ):
+        """
+        Closes every socket in an event and drops its in-memory state.
+        `reason` may be a function of the user id, for per-socket reasons.
+        """
+        removed = self.state.pop_event(event_id)
+        self.routing.pop(event_id, None)
+        self.layouts.pop(event_id, None)
+        self._initial_states.pop(event_id, None)
+        self._offline_layouts.pop(event_id, None)
+        self.snapshots.forget(event_id)
+        for user_id, websocket in removed:
+            if self.rollups is not None:
+                self.rollups.socket_closed(event_id)
+            try:
+                await websocket.close(
+                    code=code, reason=reason(user_id) if callable(reason) else reason
+                )
+            except Exception as e:
+                print(f"Error closing socket for {user_id}: {str(e)}")
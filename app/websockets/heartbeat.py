@@ -0,0 +1,74 @@
+import asyncio
+import time
+from app.websockets.connection_manager import ConnectionManager
+
+HEARTBEAT_CLOSE_CODE = 4408
+
+
+class Heartbeat:
+    """
+    Server-driven heartbeats for the realtime layer.
+
+    Every `interval` seconds each socket gets a ping message; clients answer
+    with a pong, and any message from a client counts as a sign of life.
+    Sockets silent for longer than `timeout`, or whose ping cannot be sent,
+    are removed through `ConnectionManager.disconnect` so they stop costing
+    memory and broadcast time.
+    """
+
+    def __init__(self, manager: ConnectionManager, interval: float = 20.0, timeout: float = 60.0):
+        self.manager = manager
+        self.interval = interval
+        self.timeout = timeout
+        self.pings_sent = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.beat()
+            except Exception as e:
+                print(f"Error in heartbeat: {str(e)}")
+
+    async def beat(self):
+        now = time.monotonic()
+        pings = []
+        for user_id, event_id, websocket, last_seen in self.manager.state.connected():
+            if now - last_seen > self.timeout:
+                await self.reap(user_id, event_id, websocket)
+            else:
+                pings.append(self._ping(user_id, event_id, websocket))
+        if pings:
+            await asyncio.gather(*pings)
+
+    async def _ping(self, user_id: str, event_id: str, websocket):
+        try:
+            await asyncio.wait_for(
+                websocket.send_json({"type": "ping", "data": {"ts": time.time()}}),
+                self.interval,
+            )
+            self.pings_sent += 1
+        except Exception:
+            await self.reap(user_id, event_id, websocket)
+
+    async def reap(self, user_id: str, event_id: str, websocket):
+        await self.manager.reap(user_id, event_id, websocket, code=HEARTBEAT_CLOSE_CODE)
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "timeout": self.timeout,
+            "pings_sent": self.pings_sent,
+            # Includes sockets dropped after a failed broadcast send
+            "reaped": self.manager.reaped,
+        }
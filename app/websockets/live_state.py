@@ -0,0 +1,181 @@
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+from fastapi import WebSocket
+
+
+class Interner:
+    """
+    Maps id strings to small integers and back. Each id string is stored
+    once no matter how many structures refer to it. Released integers are
+    reused, so the table stays as large as the ids currently in use rather
+    than every id ever seen.
+    """
+
+    __slots__ = ("ids", "index", "free")
+
+    def __init__(self):
+        self.ids: List[Optional[str]] = []
+        self.index: Dict[str, int] = {}
+        self.free: List[int] = []
+
+    def intern(self, value: str) -> int:
+        i = self.index.get(value)
+        if i is None:
+            if self.free:
+                i = self.free.pop()
+                self.ids[i] = value
+            else:
+                i = len(self.ids)
+                self.ids.append(value)
+            self.index[value] = i
+        return i
+
+    def get(self, value: str) -> Optional[int]:
+        return self.index.get(value)
+
+    def release(self, value: str):
+        i = self.index.pop(value, None)
+        if i is not None:
+            self.ids[i] = None
+            self.free.append(i)
+
+    def canonical(self, value: str) -> str:
+        """
+        Returns the stored copy of `value` if it is interned, so structures
+        built from freshly decoded strings share one object per live id.
+        Unknown values are returned as they are, without taking a slot.
+        """
+        i = self.index.get(value)
+        return self.ids[i] if i is not None else value
+
+    def __len__(self):
+        return len(self.index)
+
+
+class LiveState:
+    """
+    Compact store of which sockets are connected to which events.
+
+    User and event ids are interned to ints. Sockets, their event and their
+    position in that event's member array are parallel arrays indexed by
+    user, and each event's members are an unsigned int array with
+    swap-remove, so a connected attendee costs a few array slots rather
+    than per-socket objects and set entries keyed by UUID strings. A
+    user's slot is released when their socket goes, and an event's when its
+    last socket goes.
+    """
+
+    def __init__(self):
+        self.users = Interner()
+        self.events = Interner()
+        self.websockets: List[Optional[WebSocket]] = []
+        self.socket_event = array("i")  # -1 when the user has no socket
+        self.socket_slot = array("I")  # position in the event's member array
+        self.last_seen = array("d")  # monotonic time of the last client message
+        self.members: Dict[int, array] = {}
+
+    def _user(self, user_id: str) -> int:
+        user = self.users.intern(user_id)
+        while user >= len(self.websockets):
+            self.websockets.append(None)
+            self.socket_event.append(-1)
+            self.socket_slot.append(0)
+            self.last_seen.append(0.0)
+        return user
+
+    def add(self, user_id: str, event_id: str, websocket: WebSocket):
+        user = self._user(user_id)
+        if self.socket_event[user] >= 0:
+            # Keeps the user's slot, which is reused below
+            self._detach(user, release=False)
+        event = self.events.intern(event_id)
+        members = self.members.get(event)
+        if members is None:
+            members = self.members[event] = array("I")
+        self.websockets[user] = websocket
+        self.socket_event[user] = event
+        self.socket_slot[user] = len(members)
+        self.last_seen[user] = time.monotonic()
+        members.append(user)
+
+    def remove(self, user_id: str, event_id: str) -> Optional[WebSocket]:
+        user = self._connected(user_id, event_id)
+        if user is None:
+            return None
+        websocket = self.websockets[user]
+        self._detach(user)
+        return websocket
+
+    def _detach(self, user: int, release: bool = True):
+        event = self.socket_event[user]
+        members = self.members[event]
+        last = members.pop()
+        if last != user:
+            slot = self.socket_slot[user]
+            members[slot] = last
+            self.socket_slot[last] = slot
+        if not members:
+            del self.members[event]
+            self.events.release(self.events.ids[event])
+        self.websockets[user] = None
+        self.socket_event[user] = -1
+        if release:
+            self.users.release(self.users.ids[user])
+
+    def _connected(self, user_id: str, event_id: Optional[str] = None) -> Optional[int]:
+        user = self.users.get(user_id)
+        if user is None or self.socket_event[user] < 0:
+            return None
+        if event_id is not None and self.events.ids[self.socket_event[user]] != event_id:
+            return None
+        return user
+
+    def event_of(self, user_id: str) -> Optional[str]:
+        user = self._connected(user_id)
+        return self.events.ids[self.socket_event[user]] if user is not None else None
+
+    def socket(self, user_id: str, event_id: Optional[str] = None) -> Optional[WebSocket]:
+        user = self._connected(user_id, event_id)
+        return self.websockets[user] if user is not None else None
+
+    def touch(self, user_id: str):
+        user = self._connected(user_id)
+        if user is not None:
+            self.last_seen[user] = time.monotonic()
+
+    def connected(self) -> Iterator[Tuple[str, str, WebSocket, float]]:
+        """
+        Yields (user_id, event_id, websocket, last_seen) for every socket,
+        from a copy so callers may disconnect while iterating.
+        """
+        for event, members in list(self.members.items()):
+            event_id = self.events.ids[event]
+            for user in list(members):
+                yield self.users.ids[user], event_id, self.websockets[user], self.last_seen[user]
+
+    def has_event(self, event_id: str) -> bool:
+        event = self.events.get(event_id)
+        return event is not None and event in self.members
+
+    def event_size(self, event_id: str) -> int:
+        event = self.events.get(event_id)
+        return len(self.members.get(event, ())) if event is not None else 0
+
+    def member_ids(self, event_id: str) -> List[str]:
+        event = self.events.get(event_id)
+        if event is None:
+            return []
+        return [self.users.ids[user] for user in self.members.get(event, ())]
+
+    def event_ids(self) -> List[str]:
+        return [self.events.ids[event] for event in self.members]
+
+    def socket_count(self) -> int:
+        return sum(len(members) for members in self.members.values())
+
+    def pop_event(self, event_id: str) -> List[Tuple[str, WebSocket]]:
+        removed = []
+        for user_id in self.member_ids(event_id):
+            removed.append((user_id, self.remove(user_id, event_id)))
+        return removed
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import mmap
+import os
+import re
+import struct
+import time
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Each record is a fixed header followed by the JSON payload.
+RECORD_HEADER = struct.Struct("<IQd")  # payload length, sequence, timestamp
+# Sparse index entries point at every INDEX_INTERVAL-th record.
+INDEX_ENTRY = struct.Struct("<dQQ")  # timestamp, sequence, file offset
+INDEX_INTERVAL = 64
+
+EVENT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class _LogState:
+    __slots__ = ("next_seq", "size")
+
+    def __init__(self, next_seq: int, size: int):
+        self.next_seq = next_seq
+        self.size = size
+
+
+class MessageLog:
+    """
+    Append-only, per-event log of every broadcast message.
+
+    `append` only timestamps the message and puts it on a bounded queue, so
+    live broadcasts never wait on disk. A background task drains the queue in
+    batches and writes length-prefixed records from a worker thread. Reads
+    memory-map the log and use a sparse index to seek by time or sequence.
+    """
+
+    def __init__(self, directory: str, max_pending: int = 10000, batch_size: int = 256):
+        self.directory = directory
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._states: Dict[str, _LogState] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def paths(self, event_id: str) -> Tuple[str, str]:
+        if not EVENT_ID_PATTERN.match(event_id):
+            raise ValueError(f"Invalid event id for message log: {event_id!r}")
+        base = os.path.join(self.directory, event_id)
+        return base + ".log", base + ".idx"
+
+    def forget(self, event_id: str):
+        """
+        Drops the cached write position of a finished event's log. The log
+        itself stays readable, and is reopened if written to again.
+        """
+        self._states.pop(event_id, None)
+
+    def append(self, event_id: str, message: dict):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._run_writer())
+
+        try:
+            self._queue.put_nowait((event_id, time.time(), message))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def flush(self):
+        if self._queue is not None and self._writer_task and not self._writer_task.done():
+            await self._queue.join()
+
+    async def close(self):
+        await self.flush()
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+
+    async def _run_writer(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                print(f"Error writing message log: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch: List[Tuple[str, float, dict]]):
+        grouped: Dict[str, List[Tuple[float, dict]]] = {}
+        for event_id, timestamp, message in batch:
+            grouped.setdefault(event_id, []).append((timestamp, message))
+
+        for event_id, records in grouped.items():
+            log_path, index_path = self.paths(event_id)
+            state = self._states.get(event_id)
+            if state is None:
+                state = self._states[event_id] = self._load_state(log_path)
+
+            chunks = []
+            index_chunks = []
+            offset = state.size
+            for timestamp, message in records:
+                payload = json.dumps(message, separators=(",", ":"), default=str).encode()
+                if state.next_seq % INDEX_INTERVAL == 0:
+                    index_chunks.append(INDEX_ENTRY.pack(timestamp, state.next_seq, offset))
+                record = RECORD_HEADER.pack(len(payload), state.next_seq, timestamp)
+                chunks.append(record)
+                chunks.append(payload)
+                offset += len(record) + len(payload)
+                state.next_seq += 1
+
+            # The log is written before the index, so an index entry never
+            # points past the end of the log.
+            with open(log_path, "ab") as log_file:
+                log_file.write(b"".join(chunks))
+            if index_chunks:
+                with open(index_path, "ab") as index_file:
+                    index_file.write(b"".join(index_chunks))
+            state.size = offset
+
+    def _load_state(self, log_path: str) -> _LogState:
+        """
+        Finds the next sequence number and end offset of an existing log,
+        dropping a torn record left behind by a crash mid-write.
+        """
+        if not os.path.exists(log_path):
+            return _LogState(0, 0)
+
+        next_seq = 0
+        offset = 0
+        with open(log_path, "rb") as log_file:
+            size = os.fstat(log_file.fileno()).st_size
+            while offset + RECORD_HEADER.size <= size:
+                log_file.seek(offset)
+                length, seq, _ = RECORD_HEADER.unpack(log_file.read(RECORD_HEADER.size))
+                end = offset + RECORD_HEADER.size + length
+                if end > size:
+                    break
+                next_seq = seq + 1
+                offset = end
+
+        if offset != size:
+            with open(log_path, "r+b") as log_file:
+                log_file.truncate(offset)
+        return _LogState(next_seq, offset)
+
+    def _read_index(self, index_path: str) -> List[Tuple[float, int, int]]:
+        if not os.path.exists(index_path):
+            return []
+        with open(index_path, "rb") as index_file:
+            data = index_file.read()
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        return list(INDEX_ENTRY.iter_unpack(data[:usable]))
+
+    def read(
+        self,
+        event_id: str,
+        since: Optional[float] = None,
+        from_seq: Optional[int] = None,
+    ) -> Iterator[Tuple[int, float, dict]]:
+        """
+        Yields (sequence, timestamp, message) for every record at or after
+        `since` and `from_seq`, in the order they were broadcast.
+        """
+        log_path, index_path = self.paths(event_id)
+        if not os.path.exists(log_path) or os.path.getsize(log_path) == 0:
+            return
+
+        index = self._read_index(index_path)
+        start = 0
+        if from_seq is not None:
+            position = bisect_right([entry[1] for entry in index], from_seq) - 1
+            if position >= 0:
+                start = index[position][2]
+        elif since is not None:
+            position = bisect_left([entry[0] for entry in index], since) - 1
+            if position >= 0:
+                start = index[position][2]
+
+        with open(log_path, "rb") as log_file, mmap.mmap(
+            log_file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as view:
+            size = len(view)
+            offset = start
+            while offset + RECORD_HEADER.size <= size:
+                length, seq, timestamp = RECORD_HEADER.unpack_from(view, offset)
+                body = offset + RECORD_HEADER.size
+                end = body + length
+                if end > size:
+                    break
+                if (since is None or timestamp >= since) and (
+                    from_seq is None or seq >= from_seq
+                ):
+                    yield seq, timestamp, json.loads(view[body:end])
+                offset = end
@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import json
+import time
+import urllib.request
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping event ids to shards. Each shard owns many
+    virtual points so adding a shard moves roughly 1/N of events to it and
+    leaves every other assignment alone.
+    """
+
+    def __init__(self, shards: Iterable[str] = (), replicas: int = 128):
+        self.replicas = replicas
+        self._points: List[Tuple[int, str]] = []
+        self._keys: List[int] = []
+        for shard in shards:
+            self.add(shard)
+
+    def add(self, shard: str):
+        for i in range(self.replicas):
+            self._points.append((_hash(f"{shard}#{i}"), shard))
+        self._points.sort()
+        self._keys = [point for point, _ in self._points]
+
+    def remove(self, shard: str):
+        self._points = [point for point in self._points if point[1] != shard]
+        self._keys = [point for point, _ in self._points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        position = bisect_right(self._keys, _hash(key)) % len(self._points)
+        return self._points[position][1]
+
+
+def parse_peers(value: str) -> Dict[str, str]:
+    """
+    Parses "w1=http://127.0.0.1:8001,w2=http://127.0.0.1:8002" into a
+    shard id to base URL mapping.
+    """
+    peers = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        shard, _, url = item.partition("=")
+        peers[shard.strip()] = url.strip().rstrip("/")
+    return peers
+
+
+class ShardRouter:
+    """
+    Event-affinity routing between worker processes on one host.
+
+    Every worker runs with the same peer list, so they all agree on which
+    shard owns an event. Sockets for an event are only accepted by its
+    owner, which keeps fan-out in-process and per-event ordering intact.
+    Writes handled by another worker are forwarded to the owner, and
+    resource version bumps are shared with every peer.
+    """
+
+    def __init__(self, shard_id: str, peers: Dict[str, str], secret: str):
+        if shard_id not in peers:
+            raise ValueError(f"Shard {shard_id!r} is missing from its own peer list")
+        if not secret:
+            # The internal endpoints would otherwise accept an empty header
+            raise ValueError("A shard secret is required when sharding is enabled")
+        self.shard_id = shard_id
+        self.secret = secret
+        self.peers: Dict[str, str] = {}
+        # Peers whose last sync failed and may be serving stale versions
+        self.behind: Set[str] = set()
+        self.failed_syncs = 0
+        # One in-flight sync per peer, taken in arrival order
+        self._sending: Dict[str, asyncio.Lock] = {}
+        self.ring = HashRing()
+        self.set_peers(peers)
+
+    def set_peers(self, peers: Dict[str, str]):
+        for shard in set(self.peers) - set(peers):
+            self.ring.remove(shard)
+        for shard in set(peers) - set(self.peers):
+            self.ring.add(shard)
+        self.peers = dict(peers)
+        self.behind &= set(peers)
+
+    def owner(self, event_id: str) -> str:
+        return self.ring.owner(event_id)
+
+    def owns(self, event_id: str) -> bool:
+        return self.owner(event_id) == self.shard_id
+
+    def owner_url(self, event_id: str) -> str:
+        return self.peers[self.owner(event_id)]
+
+    def websocket_url(self, event_id: str, user_id: str) -> str:
+        base = self.owner_url(event_id).replace("http", "ws", 1)
+        return f"{base}/ws/{event_id}/{user_id}"
+
+    async def sync(
+        self,
+        bump: Iterable[str] = (),
+        event_id: Optional[str] = None,
+        message: Optional[dict] = None,
+    ):
+        """
+        Sends version bumps to every other shard, and the message to the
+        event's owner if that is not this shard. A peer that could not be
+        reached is told to rotate its ETag epoch on the next sync that gets
+        through, since it may have served 304s for data it never saw change.
+
+        Each peer gets its syncs one at a time, in the order they were made,
+        so two writes to one event reach its owner in the order they happened.
+        """
+        bump = list(bump)
+        owner = self.owner(event_id) if event_id is not None else None
+        shards = []
+        requests = []
+        for shard, url in self.peers.items():
+            if shard == self.shard_id:
+                continue
+            payload = {"bump": bump}
+            if message is not None and shard == owner:
+                payload["event_id"] = event_id
+                payload["message"] = message
+            elif not bump:
+                continue
+            if shard in self.behind:
+                payload["resync"] = True
+            shards.append(shard)
+            # A peer already known to be down gets one attempt, not a retry
+            attempts = 1 if shard in self.behind else 2
+            requests.append(self._send(shard, url, payload, attempts))
+        if requests:
+            results = await asyncio.gather(*requests)
+            for shard, delivered in zip(shards, results):
+                if delivered:
+                    self.behind.discard(shard)
+                else:
+                    self.failed_syncs += 1
+                    self.behind.add(shard)
+
+    async def _send(self, shard: str, url: str, payload: dict, attempts: int) -> bool:
+        lock = self._sending.setdefault(shard, asyncio.Lock())
+        async with lock:
+            return await asyncio.to_thread(self._post, url, payload, attempts)
+
+    def _post(self, url: str, payload: dict, attempts: int = 2) -> bool:
+        request = urllib.request.Request(
+            f"{url}/internal/shard-sync",
+            data=json.dumps(payload, default=str).encode(),
+            headers={"Content-Type": "application/json", "X-Shard-Secret": self.secret},
+            method="POST",
+        )
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(0.2 * attempt)
+            try:
+                with urllib.request.urlopen(request, timeout=2):
+                    return True
+            except Exception as e:
+                print(f"Error syncing with shard {url}: {str(e)}")
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "shard": self.shard_id,
+            "failed_syncs": self.failed_syncs,
+            "behind": sorted(self.behind),
+        }
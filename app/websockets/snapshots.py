@@ -0,0 +1,195 @@
+import asyncio
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.caching.versions import ResourceVersions, graph_key
+from app.database.database import SessionLocal
+from app.lifecycle.archive import decode_graph, load_archive
+from app.models import models
+
+
+def build_event_snapshot(db: Session, event: models.Event) -> dict:
+    """
+    Builds the full graph of an event: its participants and connections.
+    This is the payload sent as `initial_state` and served by the graph endpoint.
+    """
+    participants = (
+        db.query(models.EventParticipant, models.User)
+        .join(models.User, models.EventParticipant.user_id == models.User.id)
+        .filter(models.EventParticipant.event_id == event.id)
+        .all()
+    )
+
+    participant_list = [
+        {
+            "id": participant.User.id,
+            "name": participant.User.name,
+            "role": participant.EventParticipant.role,
+            "profile": participant.User.profile,
+        }
+        for participant in participants
+    ]
+
+    connections = (
+        db.query(models.Connection)
+        .filter(models.Connection.event_id == event.id)
+        .all()
+    )
+
+    return {
+        "event": {"id": event.id, "name": event.name, "type": "event"},
+        "participants": participant_list,
+        "connections": [
+            {
+                "source": conn.user_id_1,
+                "target": conn.user_id_2,
+                "status": conn.status,
+            }
+            for conn in connections
+        ],
+    }
+
+
+class CachedSnapshot:
+    """
+    A snapshot as kept between requests. Profiles are moved out of the
+    participant entries into `profiles`, as pre-encoded JSON in the same
+    order, since they are only ever sent on and JSON text is far smaller
+    than the decoded dicts.
+    """
+
+    __slots__ = ("version", "data", "profiles", "participant_ids")
+
+    def __init__(self, version: int, data: dict):
+        self.version = version
+        self.profiles: List[str] = []
+        for participant in data["participants"]:
+            self.profiles.append(
+                json.dumps(participant.pop("profile", None), separators=(",", ":"))
+            )
+        self.data = data
+        self.participant_ids = frozenset(p["id"] for p in data["participants"])
+
+    def decoded_profiles(self) -> Iterator[Tuple[dict, object]]:
+        """
+        Yields each participant entry with its decoded profile.
+        """
+        for participant, profile in zip(self.data["participants"], self.profiles):
+            yield participant, json.loads(profile)
+
+
+class SnapshotCache:
+    """
+    Shares event snapshots between connecting sockets.
+
+    Concurrent requests for the same event wait on one in-flight build, run
+    in a worker thread. Finished snapshots are kept until a write bumps the
+    event's graph version, so a connect storm costs one build per event
+    rather than one per client. Without `versions` nothing is kept and only
+    in-flight builds are shared. Snapshots are shared: callers must copy
+    before modifying them.
+    """
+
+    def __init__(self, versions: Optional[ResourceVersions] = None):
+        self.versions = versions
+        self.builds = 0
+        self.hits = 0
+        self.coalesced = 0
+        self._cached: Dict[str, CachedSnapshot] = {}
+        self._inflight: Dict[str, Tuple[int, asyncio.Future]] = {}
+
+    def current_version(self, event_id: str) -> int:
+        return self.versions.version(graph_key(event_id)) if self.versions else 0
+
+    def is_current(self, event_id: str, cached: CachedSnapshot) -> bool:
+        return self.versions is not None and cached.version == self.current_version(event_id)
+
+    async def get(self, event_id: str) -> Optional[CachedSnapshot]:
+        version = self.current_version(event_id)
+        cached = self._cached.get(event_id)
+        if cached is not None and cached.version == version:
+            self.hits += 1
+            return cached
+
+        inflight = self._inflight.get(event_id)
+        if inflight is not None and inflight[0] == version:
+            self.coalesced += 1
+            return await asyncio.shield(inflight[1])
+
+        future = asyncio.ensure_future(self._build(event_id, version))
+        self._inflight[event_id] = (version, future)
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._inflight.get(event_id, (None, None))[1] is future:
+                del self._inflight[event_id]
+
+    async def _build(self, event_id: str, version: int) -> Optional[CachedSnapshot]:
+        self.builds += 1
+        cached = await asyncio.to_thread(self._load, event_id, version)
+        if cached is None:
+            return None
+        if self.versions is not None and version == self.current_version(event_id):
+            self._cached[event_id] = cached
+        return cached
+
+    @staticmethod
+    def _load(event_id: str, version: int) -> Optional[CachedSnapshot]:
+        data = load_event_snapshot(event_id)
+        return CachedSnapshot(version, data) if data is not None else None
+
+    def forget(self, event_id: str):
+        self._cached.pop(event_id, None)
+
+    def event_ids(self) -> List[str]:
+        return list(self._cached)
+
+
+def load_event_snapshot(event_id: str) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        event = db.query(models.Event).filter(models.Event.id == event_id).first()
+        if not event:
+            return None
+        if event.archived_at is not None:
+            archive = load_archive(db, event_id)
+            return decode_graph(archive.data) if archive is not None else None
+        return build_event_snapshot(db, event)
+    finally:
+        db.close()
+
+
+def user_exists(user_id: str) -> bool:
+    db = SessionLocal()
+    try:
+        return db.query(models.User.id).filter(models.User.id == user_id).first() is not None
+    finally:
+        db.close()
+
+
+def copy_for_client(snapshot: dict) -> dict:
+    """
+    Copies the participant entries of a shared snapshot so they can be
+    annotated per request.
+    """
+    return {**snapshot, "participants": [dict(p) for p in snapshot["participants"]]}
+
+
+def encode_snapshot(snapshot: dict, profiles: List[str]) -> str:
+    """
+    Serializes a client copy of a cached snapshot, splicing each
+    participant's pre-encoded profile back in.
+    """
+    participants = []
+    for participant, profile in zip(snapshot["participants"], profiles):
+        head = json.dumps(participant, separators=(",", ":"))
+        participants.append(f'{head[:-1]},"profile":{profile}}}')
+    return (
+        '{"event":'
+        + json.dumps(snapshot["event"], separators=(",", ":"))
+        + ',"participants":['
+        + ",".join(participants)
+        + '],"connections":'
+        + json.dumps(snapshot["connections"], separators=(",", ":"))
+        + "}"
+    )
@@ -0,0 +1,205 @@
+import sys
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+SCOPES = ("event", "neighborhood", "role")
+MAX_HOPS = 3
+
+
+class Subscription:
+    """
+    What part of an event's graph a socket wants updates for: the whole
+    event, the k-hop neighborhood of a node, or nodes with given roles.
+    """
+
+    __slots__ = ("scope", "node_id", "hops", "roles")
+
+    def __init__(
+        self,
+        scope: str = "event",
+        node_id: Optional[str] = None,
+        hops: int = 1,
+        roles: Iterable[str] = (),
+    ):
+        self.scope = scope
+        self.node_id = node_id
+        self.hops = hops
+        self.roles = frozenset(roles)
+
+    @classmethod
+    def from_dict(cls, data: dict, user_id: str) -> "Subscription":
+        if not isinstance(data, dict):
+            raise ValueError("Subscription data must be an object")
+        scope = data.get("scope", "event")
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown subscription scope: {scope}")
+        hops = data.get("hops", 1)
+        if isinstance(hops, bool) or not isinstance(hops, int) or not 0 <= hops <= MAX_HOPS:
+            raise ValueError(f"hops must be an integer between 0 and {MAX_HOPS}")
+        roles = data.get("roles", [])
+        if not isinstance(roles, list) or not all(isinstance(role, str) for role in roles):
+            raise ValueError("roles must be a list of strings")
+        if scope == "role" and not roles:
+            raise ValueError("A role subscription needs at least one role")
+        node_id = data.get("node_id") or user_id
+        if not isinstance(node_id, str):
+            raise ValueError("node_id must be a string")
+        return cls(scope, node_id, hops, roles)
+
+    def as_dict(self) -> dict:
+        return {
+            "scope": self.scope,
+            "node_id": self.node_id,
+            "hops": self.hops,
+            "roles": sorted(self.roles),
+        }
+
+
+# Broadcasts that describe a change to the event's graph
+GRAPH_MESSAGE_TYPES = frozenset({"new_user", "new_connection", "node_left"})
+
+# Every socket starts with the whole-event scope, so they all share one
+WHOLE_EVENT = Subscription()
+
+
+def message_nodes(message: dict) -> List[Tuple[str, Optional[str]]]:
+    """
+    Returns the (node id, role) pairs a broadcast message is about. Messages
+    that are not about any node are delivered to every subscriber.
+    """
+    message_type = message.get("type")
+    data = message.get("data") or {}
+    if message_type == "new_user":
+        user = message.get("user") or {}
+        return [(user.get("id"), user.get("role"))]
+    if message_type == "new_connection":
+        return [(data.get("source"), None), (data.get("target"), None)]
+    if message_type == "node_left":
+        return [(data.get("user_id"), None)]
+    if message.get("sender"):
+        return [(message["sender"], None)]
+    return []
+
+
+def _role(role: Optional[str]) -> Optional[str]:
+    # Roles repeat across every participant row, so keep one copy of each
+    return sys.intern(role) if role is not None else None
+
+
+class EventRoutingIndex:
+    """
+    Per-event indexes from graph nodes and roles to the sockets interested
+    in them, so a broadcast only touches matching subscribers.
+
+    Built from the event snapshot when the first socket connects and kept
+    current from the broadcasts themselves. Ids pass through `intern` so
+    the index shares one string per user with the rest of the live state.
+    """
+
+    def __init__(self, intern: Callable[[str], str] = str):
+        self.intern = intern
+        self.roles: Dict[str, str] = {}
+        self.adjacency: Dict[str, Set[str]] = {}
+        self.subscriptions: Dict[str, Subscription] = {}
+        self.everyone: Set[str] = set()
+        self.by_role: Dict[str, Set[str]] = {}
+        self.watchers: Dict[str, Set[str]] = {}
+        self._watched: Dict[str, Set[str]] = {}
+
+    def load_snapshot(self, snapshot: dict):
+        for participant in snapshot["participants"]:
+            self.roles[self.intern(participant["id"])] = _role(participant["role"])
+        for connection in snapshot["connections"]:
+            self._link(connection["source"], connection["target"])
+
+    def apply(self, message: dict):
+        """
+        Updates the graph from a broadcast before it is routed, so a new edge
+        already counts toward the neighborhoods it joins.
+        """
+        message_type = message.get("type")
+        if message_type == "new_user":
+            user = message.get("user") or {}
+            if user.get("id"):
+                self.roles[self.intern(user["id"])] = _role(user.get("role"))
+        elif message_type == "new_connection":
+            data = message.get("data") or {}
+            if data.get("source") and data.get("target"):
+                self.add_edge(data["source"], data["target"])
+
+    def add_edge(self, source: str, target: str):
+        self._link(source, target)
+        # Only neighborhoods that already reach one of the endpoints can grow
+        affected = self.watchers.get(source, set()) | self.watchers.get(target, set())
+        for user_id in affected:
+            self._watch(user_id, self.subscriptions[user_id])
+
+    def _link(self, source: str, target: str):
+        source, target = self.intern(source), self.intern(target)
+        self.adjacency.setdefault(source, set()).add(target)
+        self.adjacency.setdefault(target, set()).add(source)
+
+    def subscribe(self, user_id: str, subscription: Subscription = WHOLE_EVENT):
+        user_id = self.intern(user_id)
+        self.unsubscribe(user_id)
+        self.subscriptions[user_id] = subscription
+        if subscription.scope == "event":
+            self.everyone.add(user_id)
+        elif subscription.scope == "role":
+            for role in subscription.roles:
+                self.by_role.setdefault(role, set()).add(user_id)
+        else:
+            self._watch(user_id, subscription)
+
+    def unsubscribe(self, user_id: str):
+        subscription = self.subscriptions.pop(user_id, None)
+        if subscription is None:
+            return
+        self.everyone.discard(user_id)
+        for role in subscription.roles:
+            subscribers = self.by_role.get(role)
+            if subscribers is not None:
+                subscribers.discard(user_id)
+                if not subscribers:
+                    del self.by_role[role]
+        self._unwatch(user_id)
+
+    def _watch(self, user_id: str, subscription: Subscription):
+        self._unwatch(user_id)
+        nodes = self.neighborhood(subscription.node_id, subscription.hops)
+        self._watched[user_id] = nodes
+        for node in nodes:
+            self.watchers.setdefault(node, set()).add(user_id)
+
+    def _unwatch(self, user_id: str):
+        for node in self._watched.pop(user_id, set()):
+            watchers = self.watchers.get(node)
+            if watchers is not None:
+                watchers.discard(user_id)
+                if not watchers:
+                    del self.watchers[node]
+
+    def neighborhood(self, center: str, hops: int) -> Set[str]:
+        seen = {center}
+        frontier = [center]
+        for _ in range(hops):
+            next_frontier = []
+            for node in frontier:
+                for neighbor in self.adjacency.get(node, ()):
+                    if neighbor not in seen:
+                        seen.add(neighbor)
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        return seen
+
+    def recipients(self, message: dict) -> Set[str]:
+        nodes = message_nodes(message)
+        if not nodes:
+            return set(self.subscriptions)
+
+        recipients = set(self.everyone)
+        for node_id, role in nodes:
+            recipients.update(self.watchers.get(node_id, ()))
+            role = role or self.roles.get(node_id)
+            if role is not None:
+                recipients.update(self.by_role.get(role, ()))
+        return recipients
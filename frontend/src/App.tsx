@@ -13,6 +13,9 @@ function App() {
   const [selectedUser, setSelectedUser] = useState<User | null>(null);
   const [hoveredNode, setHoveredNode] = useState<User | null>(null);
   const [eventName] = useState("HackED");
+  // Nodes arrive with server-computed coordinates, so the local simulation
+  // only needs to run when some are missing.
+  const [serverLayout, setServerLayout] = useState(false);
   const graphRef = useRef(null);
   const [windowSize, setWindowSize] = useState({
     width: window.innerWidth,
@@ -23,79 +26,106 @@ function App() {
 
   useEffect(() => {
     const eventId = "5f40798c-ed95-4b11-bcc3-5ab6b4a4badb";
-    const socket = new WebSocket(
-      `ws://${window.location.hostname}:8000/ws/${eventId}/${loggedInUserId}`
-    );
+    let socket: WebSocket;
+    let redirects = 0;
+    let unmounted = false;
 
-    socket.onopen = () => {
-      console.log("WebSocket connection opened");
-      setConnectionStatus("🟢 Connected");
-    };
+    const connect = (url: string) => {
+      socket = new WebSocket(url);
 
-    socket.onmessage = (event) => {
-      try {
-        const data = JSON.parse(event.data);
-
-        if (data.type === "initial_state") {
-          const nodes = data.data.participants.map((p: any) => ({
-            id: p.id,
-            name: p.name || `User ${p.id.substring(0, 5)}`,
-            role: p.role,
-            profile: p.profile,
-            color:
-              p.id === loggedInUserId
-                ? "#ffcc00"
-                : p.role === "organizer"
-                  ? "#e63946"
-                  : "#457b9d",
-          }));
-
-          setGraphData({ nodes, links: [] });
-        }
+      socket.onopen = () => {
+        console.log("WebSocket connection opened");
+        setConnectionStatus("🟢 Connected");
+      };
+
+      socket.onmessage = (event) => {
+        try {
+          const data = JSON.parse(event.data);
+
+          if (data.type === "ping") {
+            socket.send(JSON.stringify({ type: "pong" }));
+            return;
+          }
 
-        if (data.type === "new_user") {
-          setGraphData((prevData) => {
-            const newNode = {
-              id: data.user.id,
-              name: data.user.name || data.user.id,
-              role: data.user.role,
-              profile: data.user.profile,
+          if (data.type === "initial_state") {
+            const nodes = data.data.participants.map((p: any) => ({
+              id: p.id,
+              name: p.name || `User ${p.id.substring(0, 5)}`,
+              role: p.role,
+              profile: p.profile,
+              x: p.x,
+              y: p.y,
               color:
-                data.user.id === loggedInUserId
+                p.id === loggedInUserId
                   ? "#ffcc00"
-                  : data.user.role === "organizer"
+                  : p.role === "organizer"
                     ? "#e63946"
                     : "#457b9d",
-            };
-
-            if (!prevData.nodes.find((node) => node.id === newNode.id)) {
-              return {
-                nodes: [...prevData.nodes, newNode],
-                links: [
-                  ...prevData.links,
-                  { source: eventId, target: newNode.id },
-                ],
+            }));
+
+            setServerLayout(
+              nodes.length > 0 && nodes.every((n: User) => n.x !== undefined)
+            );
+            setGraphData({ nodes, links: [] });
+          }
+
+          if (data.type === "new_user") {
+            setGraphData((prevData) => {
+              const newNode = {
+                id: data.user.id,
+                name: data.user.name || data.user.id,
+                role: data.user.role,
+                profile: data.user.profile,
+                x: data.user.x,
+                y: data.user.y,
+                color:
+                  data.user.id === loggedInUserId
+                    ? "#ffcc00"
+                    : data.user.role === "organizer"
+                      ? "#e63946"
+                      : "#457b9d",
               };
-            }
-            return prevData;
-          });
+
+              if (!prevData.nodes.find((node) => node.id === newNode.id)) {
+                return {
+                  nodes: [...prevData.nodes, newNode],
+                  links: [
+                    ...prevData.links,
+                    { source: eventId, target: newNode.id },
+                  ],
+                };
+              }
+              return prevData;
+            });
+          }
+        } catch (error) {
+          console.error("Error processing message:", error);
         }
-      } catch (error) {
-        console.error("Error processing message:", error);
-      }
-    };
+      };
 
-    socket.onerror = (error) => {
-      console.error("WebSocket error:", error);
-      setConnectionStatus("🔴 Error");
-    };
+      socket.onerror = (error) => {
+        console.error("WebSocket error:", error);
+        setConnectionStatus("🔴 Error");
+      };
 
-    socket.onclose = () => {
-      console.log("WebSocket closed");
-      setConnectionStatus("⚪ Disconnected");
+      socket.onclose = (event) => {
+        // With sharding enabled, a worker that does not own the event closes
+        // with 4009 and the owner's websocket URL as the reason.
+        if (event.code === 4009 && event.reason && !unmounted && redirects < 3) {
+          redirects += 1;
+          console.log("Event lives on another shard, reconnecting:", event.reason);
+          connect(event.reason);
+          return;
+        }
+        console.log("WebSocket closed");
+        setConnectionStatus("⚪ Disconnected");
+      };
     };
 
+    connect(`ws://${window.location.hostname}:8000/ws/${eventId}/${loggedInUserId}`);
+
     return () => {
+      unmounted = true;
       socket.close();
     };
   }, []);
@@ -205,6 +235,7 @@ function App() {
             linkDirectionalParticles={2}
             linkDirectionalParticleWidth={4}
             linkDistance={50}
+            cooldownTicks={serverLayout ? 0 : undefined}
             centerAt={{ x: graphWidth / 2, y: graphHeight / 2 }}
             renderCustomCanvas={(ctx, scale) => {
               if (!graphRef.current) return;
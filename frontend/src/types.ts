@@ -3,6 +3,8 @@ export interface User {
   id: string;
   name: string;
   role: string;
+  x?: number;
+  y?: number;
   profile?: {
     github?: string;
     skills?: string[];
@@ -0,0 +1,37 @@
+"""add event activity rollups
+
+Revision ID: 7c2e91d4a5b3
+Revises: fb1a0b19b091
+Create Date: 2026-10-19 10:12:44.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e91d4a5b3'
+down_revision: Union[str, None] = 'fb1a0b19b091'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('event_activity',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.String(), nullable=False),
+    sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('joins', sa.Integer(), nullable=False),
+    sa.Column('active_sockets', sa.Integer(), nullable=False),
+    sa.Column('connections_made', sa.Integer(), nullable=False),
+    sa.Column('messages', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('event_id', 'bucket_start')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('event_activity')
@@ -0,0 +1,69 @@
+"""archive ended events
+
+Revision ID: b4d81f0e6a27
+Revises: 7c2e91d4a5b3
+Create Date: 2026-10-19 15:02:31.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d81f0e6a27'
+down_revision: Union[str, None] = '7c2e91d4a5b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('events', sa.Column('archived_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_event_participants_event_id'), 'event_participants', ['event_id'], unique=False)
+    op.create_index(op.f('ix_connections_event_id'), 'connections', ['event_id'], unique=False)
+    op.create_table('event_participants_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.String(), nullable=True),
+    sa.Column('event_id', sa.String(), nullable=True),
+    sa.Column('role', sa.String(), nullable=True),
+    sa.Column('joined_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_event_participants_archive_event_id'), 'event_participants_archive', ['event_id'], unique=False)
+    op.create_table('connections_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id_1', sa.String(), nullable=True),
+    sa.Column('user_id_2', sa.String(), nullable=True),
+    sa.Column('event_id', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ),
+    sa.ForeignKeyConstraint(['user_id_1'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id_2'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_connections_archive_event_id'), 'connections_archive', ['event_id'], unique=False)
+    op.create_table('event_archives',
+    sa.Column('event_id', sa.String(), nullable=False),
+    sa.Column('format_version', sa.Integer(), nullable=False),
+    sa.Column('participants', sa.Integer(), nullable=False),
+    sa.Column('connections', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ),
+    sa.PrimaryKeyConstraint('event_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('event_archives')
+    op.drop_index(op.f('ix_connections_archive_event_id'), table_name='connections_archive')
+    op.drop_table('connections_archive')
+    op.drop_index(op.f('ix_event_participants_archive_event_id'), table_name='event_participants_archive')
+    op.drop_table('event_participants_archive')
+    op.drop_index(op.f('ix_connections_event_id'), table_name='connections')
+    op.drop_index(op.f('ix_event_participants_event_id'), table_name='event_participants')
+    op.drop_column('events', 'archived_at')
@@ -0,0 +1,38 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_scenarios(*args: str) -> subprocess.CompletedProcess:
+    # Each run imports app.main fresh; it reads its configuration at import
+    return subprocess.run(
+        [sys.executable, "-m", "app.simulation.scenarios", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+
+
+@pytest.mark.parametrize(
+    "scenario",
+    [
+        "connect_storm",
+        "broadcast",
+        "slow_consumers",
+        "reconnect_waves",
+        "forged_writes",
+    ],
+)
+def test_scenario_passes_gate(scenario):
+    result = run_scenarios(scenario, "--users", "200", "--messages", "5")
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_open_clients_get_everything_despite_send_failures():
+    result = run_scenarios("broadcast", "--users", "200", "--messages", "5", "--fail-rate", "0.01")
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from app.caching.static_files import HASHED_NAME, IMMUTABLE, REVALIDATE, PrecompressedStaticFiles
+
+
+@pytest.mark.parametrize(
+    "name",
+    ["index-BxYz12_a.js", "index-D4f_-9kQ.css", "logo-0a1b2c3d.svg", "vendor.react-Ab3dE7gH.js"],
+)
+def test_vite_hashed_names_match(name):
+    assert HASHED_NAME.search(name)
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "android-chrome-192x192.png",
+        "my-component-Header.js",
+        "site-Webmanifest.json",
+        "icon-fallback.svg",
+        "index.html",
+        "test_client.html",
+    ],
+)
+def test_unhashed_names_do_not_match(name):
+    assert not HASHED_NAME.search(name)
+
+
+def test_only_hashed_assets_are_immutable(tmp_path):
+    (tmp_path / "index-BxYz12_a.js").write_text("console.log(1)")
+    (tmp_path / "site-Webmanifest.json").write_text("{}")
+    app = Starlette(routes=[Mount("/static", PrecompressedStaticFiles(directory=tmp_path))])
+    with TestClient(app) as client:
+        assert client.get("/static/index-BxYz12_a.js").headers["cache-control"] == IMMUTABLE
+        assert client.get("/static/site-Webmanifest.json").headers["cache-control"] == REVALIDATE
+
+
+def test_rewritten_file_gets_fresh_headers(tmp_path):
+    path = tmp_path / "app.js"
+    path.write_text("old")
+    static = PrecompressedStaticFiles(directory=tmp_path)
+    scope = {"type": "http", "method": "GET", "headers": []}
+    response = static.file_response(str(path), path.stat(), scope)
+    # Rewritten between the lookup and the read
+    path.write_text("rewritten")
+    sent = []
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(response(scope, receive, send))
+    headers = dict(sent[0]["headers"])
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    assert body == b"rewritten"
+    assert headers[b"content-length"] == str(len(body)).encode()